@@ -7,7 +7,7 @@
 ################################################################################
 {
     "name": "Email OTP Authentication",
-    "version": "0.1",
+    "version": "0.2",
     "author": "GUIGUI David",
     "sequence": 2,
     "website": "https://www.guidasworld.com/",
@@ -17,18 +17,21 @@
     "summary": """
         This module allows the user authentication of the database via OTP.
     """,
-    'depends': ['base', 'mail', 'web', 'website', 'auth_signup', "portal"],
+    'depends': ['base', 'mail', 'web', 'website', 'auth_signup', 'auth_oauth', "portal"],
     'data': [
         "security/ir.model.access.csv",
         "security/security_group.xml",
         "views/otp_verification.xml",
         "views/login_view.xml",
         "views/otp_signup.xml",
+        "views/website_view.xml",
+        "views/otp_assets.xml",
         "data/cron.xml",
+        "data/actions.xml",
     ],
 
     'assets': {
-        'web.assets_frontend': [
+        'otp_login.assets_otp': [
             'otp_login/static/src/js/signup_password_toggle.js',
             'otp_login/static/src/js/validate_password.js',
             'otp_login/static/src/js/login_otp.js',
@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+JavaScript and CSS downloaded by website pages of a running Odoo server.
+
+For every page, the ``/web/assets/`` bundles referenced by its ``<script>``
+and stylesheet ``<link>`` tags are fetched and their size reported, raw and
+gzip-compressed, bundle by bundle. Run it before and after a change of the
+asset declarations to compare:
+
+    python3 benchmarks/asset_size.py --url http://localhost:8069 \\
+        / /web/login?otp_login=true /web/signup
+
+Only the Python standard library is needed.
+"""
+import argparse
+import gzip
+import re
+import sys
+import urllib.parse
+import urllib.request
+
+_ASSET = re.compile(r"""<(?:script[^>]*\bsrc|link[^>]*\bhref)=["']([^"']*/web/assets/[^"']+)["']""")
+_BUNDLE = re.compile(r"/web/assets/(?:[^/]+/)?(?:[^/]+/)?([\w.]+?)(?:\.min)?\.(js|css)$")
+
+
+def fetch(url):
+    with urllib.request.urlopen(url, timeout=30) as response:
+        return response.read()
+
+
+def page_assets(base, path):
+    html = fetch(urllib.parse.urljoin(base, path)).decode("utf-8", "replace")
+    return sorted(set(_ASSET.findall(html)))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://localhost:8069", help="base URL of the Odoo server")
+    parser.add_argument("pages", nargs="*", default=["/", "/web/login?otp_login=true", "/web/signup"])
+    args = parser.parse_args(argv)
+
+    sizes = {}
+    for page in args.pages:
+        print(page)
+        total_raw = total_gzip = 0
+        for asset in page_assets(args.url, page):
+            if asset not in sizes:
+                content = fetch(urllib.parse.urljoin(args.url, asset))
+                sizes[asset] = (len(content), len(gzip.compress(content)))
+            raw, compressed = sizes[asset]
+            total_raw += raw
+            total_gzip += compressed
+            match = _BUNDLE.search(urllib.parse.urlparse(asset).path)
+            name = ".".join(match.groups()) if match else asset
+            print(f"    {name:<40}{raw:>12,}{compressed:>12,}")
+        print(f"    {'total':<40}{total_raw:>12,}{total_gzip:>12,}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Size of the OTP email of every theme, before and after CSS inlining.
+
+"before" is the email as it was sent with the theme CSS in a ``<style>``
+block of the pretty-printed layout, "after" the inlined and minified body
+sent now. Both are rendered with the same company, name and code; the
+script also checks that every inlined body still carries its code in the
+``otp-badge`` markup read by the load test, and exits with status 1 if an
+inlined email is not smaller or lost its code.
+
+    python3 benchmarks/email_size.py
+
+Needs markupsafe, which Odoo depends on already.
+"""
+import importlib.util
+import os
+import sys
+import types
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from otp_load import _OTP  # noqa: E402
+
+_UTILS = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "utils")
+
+
+def load_email_templates():
+    """Import utils/email_templates.py without the Odoo-dependent utils package."""
+    package = types.ModuleType("otp_login_utils")
+    package.__path__ = [_UTILS]
+    sys.modules[package.__name__] = package
+    spec = importlib.util.spec_from_file_location(
+        f"{package.__name__}.email_templates", os.path.join(_UTILS, "email_templates.py"),
+    )
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[spec.name] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+def legacy_email(templates, kind, theme, values):
+    layout = templates._EMAIL_LAYOUT.replace(
+        '<meta charset="UTF-8">', '<meta charset="UTF-8">\n        <style>{css_style}</style>',
+    )
+    texts = templates.EMAIL_KINDS[kind]
+    return layout.format(
+        css_style=templates.EMAIL_THEMES[theme],
+        logo_html=f"<img src='{values['company_logo']}' alt='{values['company_name']}'>",
+        company_name=values["company_name"],
+        company_website=values["company_website"],
+        intro=texts["intro"].format(company_name=values["company_name"]),
+        signature=texts["signature"].format(company_name=values["company_name"]),
+        name=values["name"],
+        otp_code=values["otp_code"],
+    )
+
+
+def main():
+    templates = load_email_templates()
+    values = {
+        "name": "Jane Doe", "otp_code": "4821", "company_logo": "https://example.com/logo.png",
+        "company_name": "Example Ltd", "company_phone": "+1 555 0100",
+        "company_website": "https://example.com",
+    }
+    failed = False
+    print(f"{'kind':<8}{'theme':<14}{'before':>9}{'after':>9}{'saved':>8}")
+    for kind in templates.EMAIL_KINDS:
+        for theme in templates.EMAIL_THEMES:
+            before = len(legacy_email(templates, kind, theme, values).encode())
+            body = templates.render_otp_email(kind, view_look=theme, **values)
+            after = len(body.encode())
+            match = _OTP.search(body)
+            ok = after < before and match and match.group(1) == values["otp_code"]
+            failed = failed or not ok
+            print(f"{kind:<8}{theme:<14}{before:>9,}{after:>9,}{1 - after / before:>8.0%}{'' if ok else '  FAILED'}")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
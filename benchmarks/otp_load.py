@@ -0,0 +1,389 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Load test of the OTP login and signup flows.
+
+The script creates a throwaway database with ``otp_login`` installed, starts
+an Odoo server that relays its mail to a local SMTP sink, and drives
+``--users`` simulated users (``--concurrency`` at a time) through
+
+* login:  /web/login?otp_login=true -> /web/otp/login -> read code -> /web/otp/verify
+* signup: /web/signup -> /web/signup/otp -> read code -> /web/signup/otp/verify
+
+With ``--api json`` the code is requested and verified through the JSON
+routes used by the page scripts (``/web/otp/login/json``,
+``/web/otp/verify/json``, ``/web/signup/otp/verify/json``) instead of the
+form posts.
+
+It reports the throughput of complete flows and, per route, the p50/p95/p99
+latency seen by the clients and the SQL queries per request taken from the
+server's request log.
+
+Example::
+
+    python3 benchmarks/otp_load.py --odoo-bin ~/odoo/odoo-bin \\
+        --addons-path ~/odoo/addons,~/custom --users 200 --concurrency 20
+
+Database connection options (``--db_host``, ``--db_user``...) are passed on
+to Odoo unchanged after ``--``. Only the Python standard library is needed.
+"""
+import argparse
+import http.cookiejar
+import json
+import os
+import re
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+import xmlrpc.client
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from smtp_sink import SmtpSink  # noqa: E402
+
+PASSWORD = "Bench#Pass123"
+_CSRF = re.compile(r'name="csrf_token"\s+value="([^"]+)"')
+_OTP = re.compile(r"otp-badge.*?<span[^>]*>\s*([^<\s]+)\s*</span>", re.S)
+# "POST /web/otp/login HTTP/1.1" 200 - 12 0.004 0.031
+_REQUEST_LOG = re.compile(r'"(?:GET|POST) ([^ ?"]+)\S* HTTP/[\d.]+" (\d{3}) - (\d+) ([\d.]+) ([\d.]+)')
+
+
+# -----------------------------------------------------------------------------
+# Server setup
+# -----------------------------------------------------------------------------
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def odoo_command(args, *extra):
+    return [sys.executable, args.odoo_bin, "--addons-path", args.addons_path, "-d", args.db, *extra, *args.odoo_args]
+
+
+def create_database(args):
+    print(f"Creating database {args.db}...", flush=True)
+    subprocess.run(odoo_command(args, "-i", "otp_login", "--without-demo", "all", "--stop-after-init"), check=True)
+
+
+def start_server(args, smtp_port, log_file, *extra):
+    command = odoo_command(
+        args,
+        "--db-filter", f"^{re.escape(args.db)}$",
+        "--http-port", str(args.port),
+        "--smtp", "127.0.0.1", "--smtp-port", str(smtp_port),
+        "--workers", str(args.workers),
+        "--max-cron-threads", "1",
+        "--log-level", "info",
+        "--logfile", log_file,
+        *extra,
+    )
+    server = subprocess.Popen(command)
+    url = f"http://127.0.0.1:{args.port}"
+    deadline = time.time() + 120
+    while time.time() < deadline:
+        try:
+            urllib.request.urlopen(f"{url}/web/health", timeout=2)
+            return server, url
+        except urllib.error.HTTPError:
+            return server, url
+        except OSError:
+            if server.poll() is not None:
+                raise RuntimeError("Odoo server exited during startup")
+            time.sleep(1)
+    server.terminate()
+    raise RuntimeError("Odoo server did not start in time")
+
+
+def configure(url, args, logins):
+    common = xmlrpc.client.ServerProxy(f"{url}/xmlrpc/2/common")
+    uid = common.authenticate(args.db, "admin", args.admin_password, {})
+    models = xmlrpc.client.ServerProxy(f"{url}/xmlrpc/2/object", allow_none=True)
+
+    def call(model, method, *params):
+        return models.execute_kw(args.db, uid, args.admin_password, model, method, list(params))
+
+    params = {
+        "auth_signup.invitation_scope": "b2c",
+        # The whole run comes from one IP: do not let the limiter skew it.
+        "otp_login.rate_limit_email": "0/1",
+        "otp_login.rate_limit_ip": "0/1",
+        "otp_login.mail_dispatch": args.mail_dispatch,
+    }
+    for key, value in params.items():
+        call("ir.config_parameter", "set_param", key, value)
+    existing = {user["login"] for user in call("res.users", "search_read", [("login", "in", logins)], ["login"])}
+    missing = [login for login in logins if login not in existing]
+    if missing:
+        call("res.users", "create", [{"name": login.split("@")[0], "login": login, "email": login} for login in missing])
+
+
+# -----------------------------------------------------------------------------
+# Simulated users
+# -----------------------------------------------------------------------------
+class _NoRedirect(urllib.request.HTTPRedirectHandler):
+    def redirect_request(self, *args, **kwargs):
+        return None
+
+
+class Client:
+    """One browser: its own cookie jar, every request timed per route."""
+
+    def __init__(self, url, stats):
+        self.url = url
+        self.stats = stats
+        self.opener = urllib.request.build_opener(
+            urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()), _NoRedirect(),
+        )
+
+    def request(self, path, data=None, json_data=None):
+        headers = {}
+        if json_data is not None:
+            body = json.dumps({"jsonrpc": "2.0", "method": "call", "params": {}, **json_data}).encode()
+            headers["Content-Type"] = "application/json"
+        else:
+            body = urllib.parse.urlencode(data).encode() if data is not None else None
+        route = path.split("?")[0]
+        start = time.perf_counter()
+        try:
+            request = urllib.request.Request(self.url + path, data=body, headers=headers)
+            with self.opener.open(request, timeout=60) as response:
+                status, content = response.status, response.read().decode("utf-8", "replace")
+        except urllib.error.HTTPError as error:
+            status, content = error.code, error.read().decode("utf-8", "replace")
+        self.stats.record(route, time.perf_counter() - start, status)
+        return status, content
+
+
+def read_code(sink, login):
+    message = sink.wait_for(login)
+    match = _OTP.search(message.get_body(("html",)).get_content())
+    if not match:
+        raise ValueError(f"No OTP found in the mail sent to {login}")
+    return match.group(1)
+
+
+def json_result(content):
+    """Payload of a JSON route answer, an empty dict when there is none."""
+    try:
+        return json.loads(content).get("result") or {}
+    except ValueError:
+        return {}
+
+
+def login_flow(url, sink, stats, login, api="form"):
+    client = Client(url, stats)
+    client.request("/web/login?otp_login=true")
+    if api == "json":
+        _status, content = client.request("/web/otp/login/json", json_data={"login": login})
+        if json_result(content).get("status") != "success":
+            raise RuntimeError(f"/web/otp/login/json did not send a code to {login}")
+    else:
+        status, _content = client.request("/web/otp/login", {"login": login})
+        if status != 200:
+            raise RuntimeError(f"/web/otp/login answered {status} for {login}")
+    code = read_code(sink, login)
+    if api == "json":
+        _status, content = client.request("/web/otp/verify/json", json_data={"login": login, "otp": code})
+        if json_result(content).get("status") != "success":
+            raise RuntimeError(f"/web/otp/verify/json did not log {login} in")
+        return
+    status, _content = client.request("/web/otp/verify", {"login": login, "otp": code})
+    if status not in (302, 303):
+        raise RuntimeError(f"/web/otp/verify did not log {login} in (status {status})")
+
+
+def csrf_token(client, content):
+    """CSRF token of the form in ``content``, else the one of ``/web/otp/csrf``."""
+    csrf = _CSRF.search(content)
+    if csrf:
+        return csrf.group(1)
+    _status, content = client.request("/web/otp/csrf")
+    return json.loads(content)["csrf_token"]
+
+
+def signup_flow(url, sink, stats, login, api="form"):
+    client = Client(url, stats)
+    _status, content = client.request("/web/signup")
+    values = {
+        "login": login, "name": login.split("@")[0], "password": PASSWORD,
+        "confirm_password": PASSWORD, "terms_conditions": "on",
+        "csrf_token": csrf_token(client, content),
+    }
+    status, content = client.request("/web/signup/otp", values)
+    if status != 200:
+        raise RuntimeError(f"/web/signup/otp answered {status} for {login}")
+    values.update(otp=read_code(sink, login), csrf_token=csrf_token(client, content))
+    if api == "json":
+        _status, content = client.request("/web/signup/otp/verify/json", json_data={
+            "login": login, "otp": values["otp"], "terms_conditions": True,
+        })
+        if json_result(content).get("status") != "success":
+            raise RuntimeError(f"/web/signup/otp/verify/json did not sign {login} up")
+        return
+    status, _content = client.request("/web/signup/otp/verify", values)
+    if status not in (302, 303):
+        raise RuntimeError(f"/web/signup/otp/verify did not sign {login} up (status {status})")
+
+
+class Stats:
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.statuses = defaultdict(lambda: defaultdict(int))
+        self.flows = defaultdict(int)
+        self.errors = []
+        self._lock = threading.Lock()
+
+    def record(self, route, seconds, status):
+        with self._lock:
+            self.latencies[route].append(seconds)
+            self.statuses[route][status] += 1
+
+
+def run_flows(url, sink, stats, flow, logins, concurrency, api="form"):
+    target = login_flow if flow == "login" else signup_flow
+
+    def run(login):
+        try:
+            target(url, sink, stats, login, api)
+            with stats._lock:
+                stats.flows[flow] += 1
+        except Exception as error:  # report every failure, keep the load going
+            with stats._lock:
+                stats.errors.append(f"{flow} {login}: {error}")
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(run, logins))
+    return time.perf_counter() - start
+
+
+# -----------------------------------------------------------------------------
+# Report
+# -----------------------------------------------------------------------------
+def parse_query_counts(log_file, offset=0):
+    """Return {route: [queries per request]} from the server log, after ``offset``."""
+    counts = defaultdict(list)
+    with open(log_file, encoding="utf-8", errors="replace") as log:
+        log.seek(offset)
+        for line in log:
+            match = _REQUEST_LOG.search(line)
+            if match:
+                counts[match.group(1)].append(int(match.group(3)))
+    return counts
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(int(round(fraction * (len(ordered) - 1))), len(ordered) - 1)]
+
+
+def build_report(stats, queries, durations):
+    report = {"flows": {}, "routes": {}, "errors": stats.errors}
+    for flow, seconds in durations.items():
+        report["flows"][flow] = {
+            "completed": stats.flows[flow],
+            "seconds": round(seconds, 3),
+            "per_second": round(stats.flows[flow] / seconds, 2) if seconds else 0,
+        }
+    for route, latencies in sorted(stats.latencies.items()):
+        route_queries = queries.get(route, [])
+        report["routes"][route] = {
+            "requests": len(latencies),
+            "statuses": dict(stats.statuses[route]),
+            "p50_ms": round(percentile(latencies, 0.50) * 1000, 1),
+            "p95_ms": round(percentile(latencies, 0.95) * 1000, 1),
+            "p99_ms": round(percentile(latencies, 0.99) * 1000, 1),
+            "queries_avg": round(statistics.mean(route_queries), 1) if route_queries else None,
+            "queries_max": max(route_queries) if route_queries else None,
+        }
+    return report
+
+
+def print_report(report):
+    for flow, values in report["flows"].items():
+        print(f"{flow}: {values['completed']} flows in {values['seconds']}s ({values['per_second']}/s)")
+    print(f"\n{'route':<28}{'reqs':>6}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'SQL avg':>9}{'SQL max':>9}")
+    for route, values in report["routes"].items():
+        print(f"{route:<28}{values['requests']:>6}{values['p50_ms']:>9}{values['p95_ms']:>9}{values['p99_ms']:>9}"
+              f"{values['queries_avg'] if values['queries_avg'] is not None else '-':>9}"
+              f"{values['queries_max'] if values['queries_max'] is not None else '-':>9}")
+    if report["errors"]:
+        print(f"\n{len(report['errors'])} failed flow(s), first ones:")
+        for error in report["errors"][:10]:
+            print(f"  {error}")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--odoo-bin", required=True, help="path to odoo-bin")
+    parser.add_argument("--addons-path", required=True, help="addons path including this module's parent")
+    parser.add_argument("--db", default="otp_login_bench", help="database to create and use")
+    parser.add_argument("--reuse-db", action="store_true", help="do not (re)install the module first")
+    parser.add_argument("--admin-password", default="admin")
+    parser.add_argument("--flow", choices=["login", "signup", "both"], default="both")
+    parser.add_argument("--users", type=int, default=50, help="simulated users per flow")
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--workers", type=int, default=4, help="Odoo --workers (0 = threaded)")
+    parser.add_argument("--mail-dispatch", choices=["sync", "queued"], default="sync")
+    parser.add_argument("--api", choices=["form", "json"], default="form",
+                        help="request and verify the codes with the form posts or the JSON routes")
+    parser.add_argument("--port", type=int, default=0, help="HTTP port (default: a free one)")
+    parser.add_argument("--json", help="also write the report to this file")
+    parser.add_argument("odoo_args", nargs=argparse.REMAINDER, help="extra Odoo options, after --")
+    args = parser.parse_args(argv)
+    args.odoo_args = [arg for arg in args.odoo_args if arg != "--"]
+    args.port = args.port or free_port()
+    return args
+
+
+def run(args):
+    """Run the configured flows and return the report dict."""
+    if not args.reuse_db:
+        create_database(args)
+    log_file = os.path.join(tempfile.mkdtemp(prefix="otp_bench_"), "odoo.log")
+    stats = Stats()
+    durations = {}
+    flows = ["login", "signup"] if args.flow == "both" else [args.flow]
+    run_id = int(time.time())
+    with SmtpSink() as sink:
+        server, url = start_server(args, sink.address[1], log_file)
+        try:
+            login_users = [f"bench{i}@example.com" for i in range(args.users)]
+            configure(url, args, login_users if "login" in flows else [])
+            offset = os.path.getsize(log_file)
+            for flow in flows:
+                logins = login_users if flow == "login" else [
+                    f"signup{run_id}-{i}@example.com" for i in range(args.users)
+                ]
+                durations[flow] = run_flows(url, sink, stats, flow, logins, args.concurrency, args.api)
+            time.sleep(1)  # let the last request lines reach the log
+            queries = parse_query_counts(log_file, offset)
+        finally:
+            server.terminate()
+            server.wait(30)
+    report = build_report(stats, queries, durations)
+    report["log_file"] = log_file
+    return report
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    report = run(args)
+    print_report(report)
+    if args.json:
+        with open(args.json, "w") as out:
+            json.dump(report, out, indent=2)
+    return 1 if report["errors"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
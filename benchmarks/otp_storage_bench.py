@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Insert/verify throughput and WAL volume of a logged and an UNLOGGED OTP table.
+
+Two scratch tables shaped like ``otp_verification`` (same columns and
+indexes) are created in ``--dsn``'s database, then each one goes through
+``--count`` issues (supersede UPDATE + INSERT, one transaction each, like a
+request) and ``--count`` verifications (the consuming ``UPDATE ...
+RETURNING`` of ``_verify_and_consume``). WAL volume is the distance between
+``pg_current_wal_lsn()`` before and after each phase, so run it on a
+database server with no other write activity. The tables are dropped at the
+end.
+
+    python3 benchmarks/otp_storage_bench.py --dsn "dbname=bench host=localhost"
+
+Needs psycopg2, which Odoo depends on already.
+"""
+import argparse
+import hashlib
+import sys
+import time
+
+import psycopg2
+
+SCHEMA = """
+    CREATE {persistence} TABLE {table} (
+        id serial PRIMARY KEY,
+        otp_digest varchar(64),
+        state varchar,
+        email varchar,
+        sent_at timestamp,
+        create_uid integer,
+        create_date timestamp,
+        write_uid integer,
+        write_date timestamp
+    );
+    CREATE INDEX {table}_email_live_idx ON {table} (email, create_date DESC, id DESC) WHERE state = 'unverified';
+    CREATE INDEX {table}_state_sent_at_idx ON {table} (state, sent_at);
+"""
+
+ISSUE = """
+    UPDATE {table} SET state = 'rejected' WHERE email = ANY(%(emails)s) AND state = 'unverified';
+    INSERT INTO {table} (otp_digest, state, email, sent_at, create_uid, create_date, write_uid, write_date)
+         VALUES (%(digest)s, 'unverified', %(email)s, now() at time zone 'UTC', 1,
+                 now() at time zone 'UTC', 1, now() at time zone 'UTC');
+"""
+
+VERIFY = """
+    WITH live AS (
+        SELECT id FROM {table}
+         WHERE email = %(email)s AND state = 'unverified'
+      ORDER BY create_date DESC, id DESC
+         LIMIT 1
+    )
+    UPDATE {table} o
+       SET state = CASE WHEN o.otp_digest = %(digest)s THEN 'verified' ELSE 'rejected' END,
+           write_uid = 1, write_date = now() at time zone 'UTC'
+      FROM live
+     WHERE o.id = live.id AND o.state = 'unverified'
+ RETURNING o.state
+"""
+
+
+def wal_lsn(cr):
+    cr.execute("SELECT pg_current_wal_lsn()")
+    return cr.fetchone()[0]
+
+
+def wal_bytes(cr, start):
+    cr.execute("SELECT pg_wal_lsn_diff(pg_current_wal_lsn(), %s)", [start])
+    return int(cr.fetchone()[0])
+
+
+def run_phase(conn, statement, params_list):
+    """Run one statement per transaction; return (seconds, WAL bytes)."""
+    with conn.cursor() as cr:
+        start_lsn = wal_lsn(cr)
+        conn.commit()
+        start = time.perf_counter()
+        for params in params_list:
+            cr.execute(statement, params)
+            conn.commit()
+        seconds = time.perf_counter() - start
+        written = wal_bytes(cr, start_lsn)
+        conn.commit()
+    return seconds, written
+
+
+def bench(conn, persistence, count):
+    table = f"otp_bench_{persistence.lower() or 'logged'}"
+    with conn.cursor() as cr:
+        cr.execute(f"DROP TABLE IF EXISTS {table}")
+        cr.execute(SCHEMA.format(persistence=persistence, table=table))
+    conn.commit()
+    emails = [f"user{i}@example.com" for i in range(count)]
+    digests = [hashlib.sha256(email.encode()).hexdigest() for email in emails]
+    try:
+        issue = run_phase(conn, ISSUE.format(table=table), [
+            {"emails": [email], "email": email, "digest": digest} for email, digest in zip(emails, digests)
+        ])
+        verify = run_phase(conn, VERIFY.format(table=table), [
+            {"email": email, "digest": digest} for email, digest in zip(emails, digests)
+        ])
+    finally:
+        with conn.cursor() as cr:
+            cr.execute(f"DROP TABLE IF EXISTS {table}")
+        conn.commit()
+    return issue, verify
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--dsn", required=True, help="libpq connection string of a scratch database")
+    parser.add_argument("--count", type=int, default=5000, help="codes issued and verified per table")
+    args = parser.parse_args(argv)
+
+    conn = psycopg2.connect(args.dsn)
+    try:
+        print(f"{args.count} transactions per phase")
+        print(f"{'table':<10}{'phase':<8}{'tx/s':>10}{'WAL bytes':>14}{'WAL/tx':>10}")
+        for persistence in ("", "UNLOGGED"):
+            issue, verify = bench(conn, persistence, args.count)
+            for phase, (seconds, written) in (("issue", issue), ("verify", verify)):
+                print(f"{persistence or 'LOGGED':<10}{phase:<8}{args.count / seconds:>10,.0f}"
+                      f"{written:>14,}{written / args.count:>10,.0f}")
+    finally:
+        conn.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
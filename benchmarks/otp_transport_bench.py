@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+OTP mail delivery with one SMTP connection per message against the pooled
+connections of ``utils/otp_transport.py``, on the local SMTP sink.
+
+The sink delays its greeting by ``--handshake-ms`` to stand in for the TLS
+handshake and login of a real relay. Each mode sends ``--messages`` mails
+from ``--threads`` threads; the pooled run also has the sink cut every open
+connection halfway through, and checks that the pool notices (NOOP) or
+reconnects and that no mail is lost.
+
+    python3 benchmarks/otp_transport_bench.py --messages 500 --threads 8
+
+Only the Python standard library is needed.
+"""
+import argparse
+import importlib.util
+import os
+import smtplib
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from email.message import EmailMessage
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from smtp_sink import SmtpSink  # noqa: E402
+
+_MODULE = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "utils", "otp_transport.py")
+_spec = importlib.util.spec_from_file_location("otp_transport", _MODULE)
+otp_transport = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(otp_transport)
+
+
+def build_message(index):
+    message = EmailMessage()
+    message["From"] = "noreply@example.com"
+    message["To"] = f"user{index}@example.com"
+    message["Subject"] = "Login Verification Code"
+    message.set_content(f"Your code is {index:04d}")
+    return message
+
+
+def send_direct(sink, message):
+    with smtplib.SMTP(*sink.address) as connection:
+        connection.send_message(message)
+
+
+def send_pooled(sink, pool, message):
+    connect = lambda: smtplib.SMTP(*sink.address)  # noqa: E731
+    try:
+        with pool.connection(connect) as connection:
+            connection.send_message(message)
+    except (smtplib.SMTPServerDisconnected, OSError):
+        # The block raised, so the pool closed that connection: one retry on
+        # a fresh one, like PooledSmtpTransport does.
+        with pool.connection(connect) as connection:
+            connection.send_message(message)
+
+
+def run(sink, send, messages, threads, halfway=None):
+    done = threading.Event()
+
+    def task(index):
+        if halfway and index == messages // 2 and not done.is_set():
+            done.set()
+            halfway()
+        send(build_message(index))
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(threads) as executor:
+        list(executor.map(task, range(messages)))
+    return time.perf_counter() - start
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, default=300)
+    parser.add_argument("--threads", type=int, default=4)
+    parser.add_argument("--pool-size", type=int, default=otp_transport.DEFAULT_POOL_SIZE)
+    parser.add_argument("--handshake-ms", type=float, default=20.0)
+    args = parser.parse_args(argv)
+
+    failed = False
+    print(f"{args.messages} messages, {args.threads} threads, {args.handshake_ms:g} ms handshake")
+    print(f"{'mode':<8}{'seconds':>9}{'msg/s':>9}{'connections':>13}{'delivered':>11}")
+    for mode in ("direct", "pooled"):
+        with SmtpSink(greeting_delay=args.handshake_ms / 1000) as sink:
+            if mode == "direct":
+                seconds = run(sink, lambda message: send_direct(sink, message), args.messages, args.threads)
+            else:
+                pool = otp_transport.SmtpPool(size=args.pool_size, health_check_idle=0.5)
+                seconds = run(
+                    sink, lambda message: send_pooled(sink, pool, message), args.messages, args.threads,
+                    halfway=sink.drop_connections,
+                )
+                pool.close()
+            failed = failed or sink.received != args.messages
+            print(f"{mode:<8}{seconds:>9.2f}{args.messages / seconds:>9.0f}{sink.connections:>13}"
+                  f"{sink.received:>11}")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,147 @@
+# -*- coding: utf-8 -*-
+"""
+Minimal local SMTP server that accepts every message and keeps it in memory,
+used as the mail relay of the benchmark runs.
+
+Only the commands a plain (no TLS, no AUTH) client needs are implemented.
+``greeting_delay`` holds back the greeting of every new connection, standing
+in for the TLS handshake and login of a real relay.
+"""
+import email
+import email.policy
+import re
+import socket
+import socketserver
+import threading
+import time
+from collections import defaultdict
+
+_ADDRESS = re.compile(r"<([^>]*)>")
+
+
+class _SmtpHandler(socketserver.StreamRequestHandler):
+
+    def _reply(self, line):
+        self.wfile.write(line.encode() + b"\r\n")
+        self.wfile.flush()
+
+    def handle(self):
+        sink = self.server.sink
+        sink.connected(self.connection)
+        try:
+            if sink.greeting_delay:
+                time.sleep(sink.greeting_delay)
+            self._reply("220 smtp-sink ready")
+            self._session(sink)
+        except OSError:
+            pass
+        finally:
+            sink.disconnected(self.connection)
+
+    def _session(self, sink):
+        recipients = []
+        while True:
+            raw = self.rfile.readline()
+            if not raw:
+                return
+            command = raw.decode("utf-8", "replace").strip()
+            verb = command[:4].upper()
+            if verb == "EHLO":
+                self._reply("250-smtp-sink")
+                self._reply("250-8BITMIME")
+                self._reply("250 SMTPUTF8")
+            elif verb in ("HELO", "NOOP"):
+                self._reply("250 OK")
+            elif verb in ("MAIL", "RSET"):
+                recipients = []
+                self._reply("250 OK")
+            elif verb == "RCPT":
+                match = _ADDRESS.search(command)
+                recipients.append((match.group(1) if match else command[8:]).strip().lower())
+                self._reply("250 OK")
+            elif verb == "DATA":
+                self._reply("354 End data with <CR><LF>.<CR><LF>")
+                lines = []
+                for line in iter(self.rfile.readline, b""):
+                    if line in (b".\r\n", b".\n"):
+                        break
+                    lines.append(line[1:] if line.startswith(b"..") else line)
+                sink.deliver(recipients, b"".join(lines))
+                recipients = []
+                self._reply("250 OK queued")
+            elif verb == "QUIT":
+                self._reply("221 Bye")
+                return
+            else:
+                self._reply("502 Command not implemented")
+
+
+class _Server(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class SmtpSink:
+    """Threaded SMTP sink. ``wait_for(address)`` returns the next message for it."""
+
+    def __init__(self, host="127.0.0.1", port=0, greeting_delay=0.0):
+        self._server = _Server((host, port), _SmtpHandler)
+        self._server.sink = self
+        self._messages = defaultdict(list)
+        self._condition = threading.Condition()
+        self._open = set()
+        self.greeting_delay = greeting_delay
+        self.received = 0
+        self.connections = 0
+
+    def connected(self, connection):
+        with self._condition:
+            self._open.add(connection)
+            self.connections += 1
+
+    def disconnected(self, connection):
+        with self._condition:
+            self._open.discard(connection)
+
+    def drop_connections(self):
+        """Cut every open client connection, like a relay timing out idle sessions."""
+        with self._condition:
+            connections = list(self._open)
+        for connection in connections:
+            try:
+                connection.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+    @property
+    def address(self):
+        return self._server.server_address
+
+    def deliver(self, recipients, data):
+        message = email.message_from_bytes(data, policy=email.policy.default)
+        with self._condition:
+            for recipient in recipients:
+                self._messages[recipient].append(message)
+            self.received += 1
+            self._condition.notify_all()
+
+    def wait_for(self, recipient, timeout=30):
+        recipient = recipient.lower()
+        with self._condition:
+            if not self._condition.wait_for(lambda: self._messages[recipient], timeout=timeout):
+                raise TimeoutError(f"No mail for {recipient} after {timeout}s")
+            return self._messages[recipient].pop(0)
+
+    def start(self):
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
@@ -1,2 +1,3 @@
 from . import otp_login
 from . import otp_signup
+from . import otp_metrics
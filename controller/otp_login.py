@@ -1,51 +1,62 @@
 # -*- coding: utf-8 -*-
 import logging
-import string
-from random import choice
+from urllib.parse import urlsplit, urlunsplit
 
 from odoo import http, _
 from odoo.addons.web.controllers.home import Home, ensure_db
 from odoo.http import request
 from odoo.exceptions import UserError
-from odoo.addons.otp_login.utils.email_templates import otp_login_html
+from odoo.addons.otp_login.utils.email_templates import otp_login_html, DEFAULT_EMAIL_THEME
+from odoo.addons.otp_login.utils.otp_store import get_otp_store
+from odoo.addons.otp_login.utils.otp_generator import get_otp_generator
+from odoo.addons.otp_login.utils.rate_limit import check_rate_limit
+from odoo.addons.otp_login.utils.login_ticket import issue_login_ticket
+from odoo.addons.otp_login.utils import metrics
+from odoo.addons.otp_login.utils.page_cache import is_page_cacheable, render_cached_page
+from odoo.addons.otp_login.models.otp_trusted_device import TRUSTED_DEVICE_COOKIE
 
 _logger = logging.getLogger(__name__)
 
 
+def local_url(url):
+    """Path and query of ``url``: the JSON routes only send the browser within the site."""
+    parsed = urlsplit(url or "/")
+    # Browsers read a backslash as a slash: "/\\evil.com" is "//evil.com",
+    # another host. Strip both, as request.redirect(local=True) does.
+    return urlunsplit(("", "", "/" + parsed.path.lstrip("/\\"), parsed.query, parsed.fragment))
+
+
 class OtpLoginHome(Home):
 
     # -------------------------------------------------------------------------
     # EMAIL TEMPLATE BUILDERS
     # -------------------------------------------------------------------------
+    def _get_otp_email_theme(self):
+        """Email theme configured on the current website."""
+        website = getattr(request, "website", None)
+        return website.otp_email_theme if website else DEFAULT_EMAIL_THEME
+
     def _build_login_otp_email(self, email, name, otp_code):
         """Return subject, sender, and HTML body for Login OTP email."""
-        company = request.env.company
-        company_name = company.name or "Your Company"
-        base_url = request.env["ir.config_parameter"].sudo().get_param("web.base.url")
-        email_from = company.email or f"noreply@{base_url.split('//')[-1]}"
-        company_logo = (
-            f"{base_url}/web/image/res.company/{company.id}/logo"
-            if company.logo else ""
-        )
-        company_website = company.website or "#"
-        company_phone = company.phone or "N/A"
+        branding = request.env.company._get_otp_branding()
 
-        subject = f"[{company_name}] Login Verification Code"
+        subject = f"[{branding.company_name}] Login Verification Code"
 
-        body_html = otp_login_html(company_logo=company_logo, company_name=company_name, name=name, otp_code=otp_code, company_phone=company_phone, company_website=company_website, view_look="neogreen")
-        return subject, email_from, body_html
+        body_html = otp_login_html(company_logo=branding.logo_url, company_name=branding.company_name, name=name, otp_code=otp_code, company_phone=branding.phone, company_website=branding.website, view_look=self._get_otp_email_theme(), lang=request.env.lang)
+        return subject, branding.email_from, body_html
 
     def _send_login_otp_email(self, email, name, otp_code):
         """Build and send OTP email."""
-        subject, email_from, body_html = self._build_login_otp_email(email, name, otp_code)
-        mail = request.env["mail.mail"].sudo().create({
-            "subject": subject,
-            "email_from": email_from,
-            "email_to": email,
-            "body_html": body_html,
-        })
-        mail.send()
-        _logger.info("OTP email sent to %s", email)
+        with metrics.timed("login", "render"):
+            subject, email_from, body_html = self._build_login_otp_email(email, name, otp_code)
+        with metrics.timed("login", "mail_send"):
+            request.env["mail.mail"].sudo()._otp_dispatch({
+                "subject": subject,
+                "email_from": email_from,
+                "email_to": email,
+                "body_html": body_html,
+            })
+        _logger.info("OTP email dispatched to %s", email)
         return True
 
     # -------------------------------------------------------------------------
@@ -63,12 +74,15 @@ class OtpLoginHome(Home):
 
         # Render custom OTP screens
         if request.httprequest.method == "GET":
-            if kw.get("otp_login") and kw.get("otp"):
-                return request.render("otp_login.custom_login_template", {"otp": True, "otp_login": True})
-            elif kw.get("otp_login"):
-                return request.render("otp_login.custom_login_template", {"otp_login": True})
-            else:
+            if not kw.get("otp_login"):
                 return super().web_login(redirect, **kw)
+            values = {"otp": True, "otp_login": True} if kw.get("otp") else {"otp_login": True}
+            values["otp_trusted_device_days"] = request.env["otp.trusted.device"].sudo()._lifetime_days()
+            if is_page_cacheable():
+                return render_cached_page(
+                    "otp_login.custom_login_template", lambda: values, "code" if kw.get("otp") else "email",
+                )
+            return request.render("otp_login.custom_login_template", values)
 
         # POST (form submission)
         if kw.get("login"):
@@ -78,80 +92,216 @@ class OtpLoginHome(Home):
 
         return super().web_login(redirect, **kw)
 
+    @http.route("/web/otp/csrf", type="http", auth="public", methods=["GET"], sitemap=False)
+    def web_otp_csrf(self):
+        """CSRF token of the visitor, for clients posting the OTP forms without rendering them."""
+        return request.make_json_response(
+            {"csrf_token": request.csrf_token()}, headers=[("Cache-Control", "no-store")],
+        )
+
     # -------------------------------------------------------------------------
     # OTP GENERATION
     # -------------------------------------------------------------------------
-    def generate_otp(self, length=4):
-        return ''.join(choice(string.digits) for _ in range(length))
+    def generate_otp(self, length=None):
+        """Random code of ``otp_login.otp_length`` characters unless ``length`` is given."""
+        return get_otp_generator(request.env).generate(length)
+
+    def _issue_login_otp(self, email, name):
+        """
+        Issue and mail a new code to ``email``, unless one went out within
+        the resend window. Returns False when the request was coalesced.
+        """
+        store = get_otp_store(request.env)
+        if store.coalesce(email):
+            metrics.count("login", "coalesced")
+            return False
+        with metrics.timed("login", "code_generation"):
+            otp = self.generate_otp()
+        with metrics.timed("login", "persistence"):
+            store.issue(email, otp)
+        self._send_login_otp_email(email, name, otp)
+        metrics.count("login", "issued")
+        return True
+
+    # -------------------------------------------------------------------------
+    # THROTTLING
+    # -------------------------------------------------------------------------
+    def _otp_retry_after(self, email):
+        """Seconds to wait before another OTP may be sent to email, 0 if allowed."""
+        retry_after = check_rate_limit(request.env, "login", [
+            ("email", email.lower()),
+            ("ip", request.httprequest.remote_addr),
+        ])
+        if retry_after:
+            metrics.count("login", "throttled")
+        return retry_after
+
+    def _otp_throttled_message(self, retry_after):
+        return _("Too many OTP requests. Please try again in %s seconds.", retry_after)
+
+    def _otp_json(self, payload):
+        """Payload of a JSON route, with the Retry-After header of a throttled request."""
+        if payload.get("retry_after"):
+            request.future_response.headers["Retry-After"] = str(payload["retry_after"])
+        return payload
+
+    # -------------------------------------------------------------------------
+    # TRUSTED DEVICES
+    # -------------------------------------------------------------------------
+    def _otp_trusted_user(self, email):
+        """User ``email`` when this browser is one of its trusted devices, else empty."""
+        token = request.httprequest.cookies.get(TRUSTED_DEVICE_COOKIE)
+        user = request.env["otp.trusted.device"].sudo()._check(token, email)
+        if user:
+            metrics.count("login", "trusted_device")
+        return user
+
+    def _otp_trust_device(self, user):
+        """Remember this browser for ``user``, when ``otp_login.trusted_device_days`` allows it."""
+        Devices = request.env["otp.trusted.device"].sudo()
+        days = Devices._lifetime_days()
+        if not days:
+            return
+        token = Devices._issue(user, days, user_agent=request.httprequest.user_agent.string)
+        request.future_response.set_cookie(
+            TRUSTED_DEVICE_COOKIE, token, max_age=days * 24 * 3600, httponly=True,
+            secure=request.httprequest.scheme == "https", samesite="Lax",
+        )
+
+    def _otp_login_page(self, user):
+        """Log ``user`` in through ``web_login`` with a one-shot ticket."""
+        # ResUsers._login accepts the ticket directly
+        request.params.update({
+            "login": user.login,
+            "password": issue_login_ticket(request.env, user.id),
+        })
+        return self.web_login()
+
+    def _otp_login_json(self, user, redirect=None):
+        """Log ``user`` in and return the URL to go to, as ``web_login`` would redirect."""
+        auth_info = request.session.authenticate(request.db, {
+            "login": user.login,
+            "password": issue_login_ticket(request.env, user.id),
+            "type": "password",
+        })
+        request.params["login_success"] = True
+        return {"status": "success", "redirect": local_url(self._login_redirect(auth_info["uid"], redirect=redirect))}
 
     # -------------------------------------------------------------------------
     # SEND OTP
     # -------------------------------------------------------------------------
+    def _otp_login_issue(self, email):
+        """
+        Mail a login code to ``email``. Returns the payload of the JSON
+        routes: ``status`` and ``message``, with an ``error`` code
+        (``missing``, ``throttled``, ``unknown_login``) and ``retry_after``
+        when the code was not sent.
+        """
+        if not email:
+            return {"status": "error", "error": "missing", "message": _("Email is required.")}
+
+        retry_after = self._otp_retry_after(email)
+        if retry_after:
+            return {
+                "status": "error", "error": "throttled",
+                "message": self._otp_throttled_message(retry_after), "retry_after": retry_after,
+            }
+
+        with metrics.timed("login", "user_lookup"):
+            user = request.env["res.users"].sudo().search([("login", "=", email)], limit=1)
+        if not user:
+            return {"status": "error", "error": "unknown_login", "message": _("The Email entered is incorrect.")}
+
+        if not self._issue_login_otp(email, user.name):
+            return {"status": "success", "message": _("An OTP was sent a few seconds ago, please check your inbox.")}
+        return {"status": "success", "message": _("OTP sent successfully")}
+
     @http.route("/web/otp/login", type="http", auth="public", website=True, csrf=False)
     def web_otp_login(self, **kw):
         email = str(kw.get("login", "")).strip()
-        if not email:
-            return request.render("otp_login.custom_login_template", {"error": _("Email is required.")})
+        trusted = self._otp_trusted_user(email)
+        if trusted:
+            return self._otp_login_page(trusted)
 
-        user = request.env["res.users"].sudo().search([("login", "=", email)], limit=1)
-        if not user:
+        result = self._otp_login_issue(email)
+        if result["status"] == "success":
+            return request.render("otp_login.custom_login_template", {
+                "otp_login": True,
+                "otp": True,
+                "login": email,
+                "otp_trusted_device_days": request.env["otp.trusted.device"].sudo()._lifetime_days(),
+            })
+        if result["error"] == "unknown_login":
             return request.render("otp_login.custom_login_template", {
                 "otp": False, "otp_login": True, "login_error": True, "login": email
             })
+        if result["error"] == "throttled":
+            return request.render(
+                "otp_login.custom_login_template", {"error": result["message"]},
+                status=429, headers=[("Retry-After", str(result["retry_after"]))],
+            )
+        return request.render("otp_login.custom_login_template", {"error": result["message"]})
 
-        otp = self.generate_otp(4)
-        self._send_login_otp_email(email, user.name, otp)
-        request.env["otp.verification"].sudo().create({"otp": otp, "email": email})
-
-        return request.render("otp_login.custom_login_template", {
-            "otp_login": True,
-            "otp": True,
-            "login": email
-        })
+    @http.route("/web/otp/login/json", type="json", auth="public", website=True, csrf=False)
+    def web_otp_login_json(self, **kw):
+        """``/web/otp/login`` for the login page script: a status instead of a page."""
+        data = request.get_json_data() or {}
+        email = str(data.get("login") or "").strip()
+        trusted = self._otp_trusted_user(email)
+        if trusted:
+            return self._otp_login_json(trusted, redirect=data.get("redirect"))
+        return self._otp_json(self._otp_login_issue(email))
 
     # -------------------------------------------------------------------------
     # VERIFY OTP
     # -------------------------------------------------------------------------
+    def _otp_login_user(self, email, otp_input):
+        """User logged in by the code ``otp_input`` of ``email``, empty when it is rejected."""
+        Users = request.env["res.users"].sudo()
+        if not email or not otp_input:
+            return Users
+
+        with metrics.timed("login", "verify"):
+            state = get_otp_store(request.env).verify(email, otp_input)
+        metrics.count("login", state or "rejected")
+        if state != "verified":
+            return Users
+
+        with metrics.timed("login", "user_lookup"):
+            return Users.search([("login", "=", email)], limit=1)
+
     @http.route("/web/otp/verify", type="http", auth="public", website=True, csrf=False)
     def web_otp_verify(self, **kw):
         email = str(kw.get("login", "")).strip()
-        otp_input = str(kw.get("otp", "")).strip()
-        if not email or not otp_input:
-            return request.render("otp_login.custom_login_template", {
-                "otp": True, "otp_login": True, "login": email, "otp_error": True
-            })
-
-        record = request.env["otp.verification"].sudo().search(
-            [("email", "=", email)], order="create_date desc", limit=1
-        )
-        if not record:
+        user = self._otp_login_user(email, str(kw.get("otp", "")).strip())
+        if not user:
             return request.render("otp_login.custom_login_template", {
-                "otp": True, "otp_login": True, "login": email, "otp_error": True
+                "otp": True, "otp_login": True, "login": email, "otp_error": True,
+                "otp_trusted_device_days": request.env["otp.trusted.device"].sudo()._lifetime_days(),
             })
 
-        if record.otp != otp_input:
-            record.state = "rejected"
-            return request.render("otp_login.custom_login_template", {
-                "otp": True, "otp_login": True, "login": email, "otp_error": True
-            })
+        if kw.get("remember"):
+            self._otp_trust_device(user)
+        return self._otp_login_page(user)
 
-        record.state = "verified"
-        user = request.env["res.users"].sudo().search([("login", "=", email)], limit=1)
+    @http.route("/web/otp/verify/json", type="json", auth="public", website=True, csrf=False)
+    def web_otp_verify_json(self, **kw):
+        """
+        ``/web/otp/verify`` for the login page script: logs the session in
+        and answers with the URL to go to, as ``web_login`` would redirect.
+        """
+        data = request.get_json_data() or {}
+        email = str(data.get("login") or "").strip()
+        user = self._otp_login_user(email, str(data.get("otp") or "").strip())
         if not user:
-            return request.render("otp_login.custom_login_template", {
-                "otp": True, "otp_login": True, "login": email, "otp_error": True
-            })
+            return {
+                "status": "error", "error": "invalid_code",
+                "message": _("The OTP you entered is invalid. Please try again."),
+            }
 
-        # Simulate login using special password suffix
-        request.env.cr.execute(
-            "SELECT COALESCE(password, '') FROM res_users WHERE id=%s", [user.id]
-        )
-        hashed = request.env.cr.fetchone()[0]
-        request.params.update({
-            "login": user.login,
-            "password": hashed + "mobile_otp_login",
-        })
-        return self.web_login()
+        if data.get("remember"):
+            self._otp_trust_device(user)
+        return self._otp_login_json(user, redirect=data.get("redirect"))
 
     # -------------------------------------------------------------------------
     # RESEND OTP
@@ -159,19 +309,4 @@ class OtpLoginHome(Home):
     @http.route("/web/otp/resend", type="json", auth="public", website=True, csrf=False)
     def web_otp_resend(self, **kw):
         data = request.get_json_data() or {}
-        email = data.get("login")
-        if not email:
-            return {"status": "error", "message": "Missing email"}
-
-        user = request.env["res.users"].sudo().search([("login", "=", email)], limit=1)
-        if not user:
-            return {"status": "error", "message": "Email not found"}
-
-        otp = self.generate_otp(4)
-        request.env["otp.verification"].sudo().create({"otp": otp, "email": email})
-        self._send_login_otp_email(email, user.name, otp)
-
-        return {"status": "success", "message": "OTP resent successfully"}
-
-
-
+        return self._otp_json(self._otp_login_issue(str(data.get("login") or "").strip()))
@@ -0,0 +1,42 @@
+# -*- coding: utf-8 -*-
+from hmac import compare_digest
+
+from werkzeug.exceptions import NotFound
+
+from odoo import http
+from odoo.http import request
+from odoo.addons.otp_login.utils import metrics
+from odoo.addons.otp_login.utils.email_templates import email_template_cache_info
+from odoo.addons.otp_login.utils.otp_transport import smtp_pools_info
+
+
+class OtpMetrics(http.Controller):
+
+    @http.route("/otp_login/metrics", type="http", auth="public", methods=["GET"], csrf=False, sitemap=False)
+    def otp_metrics(self):
+        """
+        Prometheus scrape endpoint. Only answers requests carrying
+        ``Authorization: Bearer <otp_login.metrics_token>``; without a
+        configured token the endpoint does not exist.
+        """
+        token = request.env["ir.config_parameter"].sudo().get_param("otp_login.metrics_token")
+        authorization = request.httprequest.headers.get("Authorization", "")
+        if not token or not compare_digest(authorization.encode(), f"Bearer {token}".encode()):
+            raise NotFound()
+
+        queue = request.env["mail.mail"].sudo()._otp_mail_queue_stats()
+        cache = email_template_cache_info()
+        pools = smtp_pools_info().values()
+        extra = [
+            *metrics.gauge_lines("otp_login_mail_queue_depth", "OTP mails waiting to be sent.", queue["depth"]),
+            *metrics.gauge_lines("otp_login_mail_queue_oldest_seconds", "Age of the oldest pending OTP mail.", queue["oldest_age"]),
+            *metrics.gauge_lines("otp_login_email_cache_hits", "Email skeleton cache hits.", cache["hits"]),
+            *metrics.gauge_lines("otp_login_email_cache_misses", "Email skeleton cache misses.", cache["misses"]),
+            *metrics.gauge_lines("otp_login_email_cache_size", "Email skeletons cached.", cache["size"]),
+            *metrics.gauge_lines("otp_login_smtp_connections_opened", "Pooled SMTP connections opened.", sum(pool["opened"] for pool in pools)),
+            *metrics.gauge_lines("otp_login_smtp_connections_reused", "Pooled SMTP connection checkouts served from the pool.", sum(pool["reused"] for pool in pools)),
+        ]
+        return request.make_response(metrics.render_metrics(extra), headers=[
+            ("Content-Type", "text/plain; version=0.0.4; charset=utf-8"),
+            ("Cache-Control", "no-store"),
+        ])
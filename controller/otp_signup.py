@@ -1,21 +1,32 @@
 
 
 import logging
-import re
-import string
-from random import choice
+import secrets
 
 from odoo import http, _
 from odoo.http import request
 from odoo.addons.auth_signup.controllers.main import AuthSignupHome
+from odoo.addons.auth_signup.models.res_users import SignupError
 from odoo.exceptions import UserError
 from odoo.addons.auth_oauth.controllers.main import OAuthLogin
-from odoo.addons.otp_login.utils.email_templates import otp_signup_html
+from odoo.addons.otp_login.utils.email_templates import otp_signup_html, DEFAULT_EMAIL_THEME
+from odoo.addons.otp_login.utils.otp_store import get_otp_store
+from odoo.addons.otp_login.utils.otp_generator import get_otp_generator
+from odoo.addons.otp_login.utils.rate_limit import check_rate_limit
+from odoo.addons.otp_login.utils import metrics
+from odoo.addons.otp_login.utils.page_cache import is_page_cacheable, render_cached_page
+from odoo.addons.otp_login.controller.otp_login import local_url
 
 
 
 _logger = logging.getLogger(__name__)
 
+# Stand-in for the password field of a verified OTP signup: the real
+# password is only known as the hash of its pending signup.
+OTP_SIGNUP_PASSWORD = "otp_pending_signup"
+# Session key binding a pending signup to the browser that posted it.
+OTP_SIGNUP_SESSION_KEY = "otp_signup_nonce"
+
 
 class OtpSignupHome(AuthSignupHome):
     """Custom Signup Controller with OTP verification."""
@@ -27,67 +38,98 @@ class OtpSignupHome(AuthSignupHome):
     # --------------------------------------------------
 
 
+    def _get_otp_email_theme(self):
+        """Email theme configured on the current website."""
+        website = getattr(request, "website", None)
+        return website.otp_email_theme if website else DEFAULT_EMAIL_THEME
+
     def _build_otp_email(self, email, name, otp_code):
         """Return subject, body_html for OTP email."""
-        company = request.env.company
-        email_from = company.email or "noreply@example.com"
-        company_name = company.name or "Your Company"
-        # company_logo = f"/web/image/res.company/{company.id}/logo" if company.logo else ""
-        base_url = request.env["ir.config_parameter"].sudo().get_param("web.base.url")
-        company_logo = ""
-        if company.logo:
-            company_logo = f"{base_url}/web/image/res.company/{company.id}/logo"
-        company_website = company.website or "#"
-        company_phone = company.phone or "N/A"
-
-        subject = _(f"[{company_name}] Verify Your Account - OTP Required")
-
-        body_html = otp_signup_html(company_logo=company_logo, company_name=company_name, name=name, otp_code=otp_code, company_phone=company_phone, company_website=company_website, view_look="neogreen")
-        return subject, email_from, body_html
+        branding = request.env.company._get_otp_branding()
+
+        subject = _(f"[{branding.company_name}] Verify Your Account - OTP Required")
+
+        body_html = otp_signup_html(company_logo=branding.logo_url, company_name=branding.company_name, name=name, otp_code=otp_code, company_phone=branding.phone, company_website=branding.website, view_look=self._get_otp_email_theme(), lang=request.env.lang)
+        return subject, branding.email_from, body_html
 
     def _send_otp_email(self, email, name, otp_code):
         """Build and send OTP email."""
-        subject, email_from, body_html = self._build_otp_email(email, name, otp_code)
-        mail = request.env['mail.mail'].sudo().create({
-            'subject': subject,
-            'email_from': email_from,
-            'email_to': email,
-            'body_html': body_html,
-        })
-        mail.send()
-        return mail
+        with metrics.timed("signup", "render"):
+            subject, email_from, body_html = self._build_otp_email(email, name, otp_code)
+        with metrics.timed("signup", "mail_send"):
+            return request.env['mail.mail'].sudo()._otp_dispatch({
+                'subject': subject,
+                'email_from': email_from,
+                'email_to': email,
+                'body_html': body_html,
+            })
 
 
 
 
     def _is_valid_password(self, password):
         """Validate password complexity rules."""
-        if not password:
-            return False
-        if len(password) < 8 or len(password) > 20:
-            return False
-        if not re.search(r"[A-Z]", password):  # uppercase
-            return False
-        if not re.search(r"[a-z]", password):  # lowercase
-            return False
-        if not re.search(r"\d", password):  # digit
-            return False
-        if not re.search(r"[!@#$%^&*(),.?\":{}|<>_\-+=;']", password):  # symbol
-            return False
-        return True
+        return not self._check_password(password)
+
+    def _check_password(self, password):
+        """Return an error message when password breaks the policy, else None."""
+        policy = request.env['res.users'].sudo()._get_password_policy()
+        return policy.message(policy.check(password))
 
 
 
-    def generate_otp(self, number_of_digits):
-        otp = ''.join(choice(string.digits) for _ in range(number_of_digits))
-        _logger.info("Generated OTP: %s", otp)
-        return otp
+    def generate_otp(self, number_of_digits=None):
+        return get_otp_generator(request.env).generate(number_of_digits)
 
 
+    def _issue_signup_otp(self, email, name):
+        """
+        Issue and mail a new code to ``email``, unless one went out within
+        the resend window. Returns False when the request was coalesced.
+        """
+        store = get_otp_store(request.env)
+        if store.coalesce(email):
+            metrics.count("signup", "coalesced")
+            return False
+        with metrics.timed("signup", "code_generation"):
+            otp_code = self.generate_otp()
+        with metrics.timed("signup", "persistence"):
+            store.issue(email, otp_code)
+        self._send_otp_email(email, name, otp_code)
+        metrics.count("signup", "issued")
+        return True
+
+    def _otp_signup_nonce(self, create=False):
+        """Nonce of the pending signups of this browser session."""
+        nonce = request.session.get(OTP_SIGNUP_SESSION_KEY)
+        if not nonce and create:
+            nonce = request.session[OTP_SIGNUP_SESSION_KEY] = secrets.token_urlsafe(24)
+        return nonce
+
+    def _otp_retry_after(self, email):
+        """Seconds to wait before another OTP may be sent to email, 0 if allowed."""
+        retry_after = check_rate_limit(request.env, "signup", [
+            ("email", email.lower()),
+            ("ip", request.httprequest.remote_addr),
+        ])
+        if retry_after:
+            metrics.count("signup", "throttled")
+        return retry_after
+
+    def _otp_throttled_message(self, retry_after):
+        return _("Too many OTP requests. Please try again in %s seconds.", retry_after)
+
     def _get_oauth_providers(self):
         """Get real OAuth providers to show on signup page."""
         try:
-            return OAuthLogin().list_providers()
+            # The redirect and token parameters are baked into the links.
+            if request.params.get("redirect") or request.params.get("token"):
+                return OAuthLogin().list_providers()
+            website = getattr(request, "website", None)
+            providers = request.env["auth.oauth.provider"].sudo()._otp_signup_providers(
+                website.id if website else False, request.httprequest.url_root,
+            )
+            return [dict(provider) for provider in providers]
         except Exception as e:
             _logger.warning("Failed to load OAuth providers: %s", e)
             return []
@@ -95,6 +137,24 @@ class OtpSignupHome(AuthSignupHome):
 
 
 
+    # --------------------------------------------------
+    # Signup page
+    # --------------------------------------------------
+    @http.route()
+    def web_auth_signup(self, *args, **kw):
+        """Serve the bare signup page (no token, no redirect) from the page cache."""
+        if not request.params and is_page_cacheable() and \
+                request.env['res.users'].sudo()._get_signup_invitation_scope() == 'b2c':
+            def values():
+                qcontext = self.get_auth_signup_qcontext()
+                qcontext['providers'] = self._get_oauth_providers()
+                return qcontext
+            response = render_cached_page('auth_signup.signup', values, "signup")
+            response.headers['X-Frame-Options'] = 'SAMEORIGIN'
+            response.headers['Content-Security-Policy'] = "frame-ancestors 'self'"
+            return response
+        return super().web_auth_signup(*args, **kw)
+
     # --------------------------------------------------
     # OTP Step 1: Initial signup (send OTP)
     # --------------------------------------------------
@@ -105,98 +165,164 @@ class OtpSignupHome(AuthSignupHome):
         # Include OAuth providers
         qcontext['providers'] = self._get_oauth_providers()
 
-        password = qcontext.get("password")
-        confirm_password = qcontext.get("confirm_password")
+        # Passwords are never rendered back, not even on errors.
+        password = qcontext.pop("password", None)
+        confirm_password = qcontext.pop("confirm_password", None)
 
         if not (password and password == confirm_password):
             qcontext["error"] = _("Passwords do not match, please retype them.")
             return request.render('otp_login.custom_otp_signup', qcontext)
 
-        if not self._is_valid_password(password):
-            qcontext["error"] = _(
-                "Password must be 8–20 characters long and include at least: "
-                "one uppercase letter, one lowercase letter, one number, and one special character."
-            )
+        password_error = self._check_password(password)
+        if password_error:
+            qcontext["error"] = password_error
             return request.render('otp_login.custom_otp_signup', qcontext)
 
-        if request.env["res.users"].sudo().search([("login", "=", qcontext.get("login"))]):
+        retry_after = self._otp_retry_after(str(qcontext.get("login") or ""))
+        if retry_after:
+            qcontext["error"] = self._otp_throttled_message(retry_after)
+            return request.render('otp_login.custom_otp_signup', qcontext,
+                                  status=429, headers=[("Retry-After", str(retry_after))])
+
+        with metrics.timed("signup", "user_lookup"):
+            existing = request.env["res.users"].sudo().search([("login", "=", qcontext.get("login"))])
+        if existing:
             qcontext["error"] = _("Another user is already registered using this email address.")
             return request.render('otp_login.custom_otp_signup', qcontext)
 
-        otp_code = self.generate_otp(4)
         email = str(qcontext.get('login'))
         name = str(qcontext.get('name'))
-
-        self._send_otp_email(email, name, otp_code)
-
-        request.env['otp.verification'].sudo().create({
-            'otp': otp_code,
-            'email': email,
-        })
+        # The password stays on the server from here on, hashed while the
+        # user reads the email.
+        request.env['otp.signup.pending'].sudo()._stage(
+            email, name, password, self._otp_signup_nonce(create=True),
+            terms_accepted=bool(qcontext.get("terms_conditions")),
+        )
+        self._issue_signup_otp(email, name)
 
         return request.render('otp_login.custom_otp_signup', {
             'otp': True,
             'otp_login': True,
             'login': email,
-            'otp_no': otp_code,
             'name': name,
-            'password': password,
-            'confirm_password': confirm_password,
-            'providers': self._get_oauth_providers(),  # include real OAuth
+            'providers': qcontext['providers'],  # include real OAuth
         })
 
     # --------------------------------------------------
     # OTP Step 2: Verify OTP and create user
     # --------------------------------------------------
+    def _send_account_created_email(self, login):
+        """The account creation confirmation of the regular signup."""
+        Users = request.env['res.users']
+        user_sudo = Users.sudo().search(Users._get_login_domain(login), order=Users._get_login_order(), limit=1)
+        template = request.env.ref('auth_signup.mail_template_user_signup_account_created', raise_if_not_found=False)
+        if user_sudo and template:
+            template.sudo().send_mail(user_sudo.id, force_send=True)
+
+    def _otp_signup_create_account(self, pending, password_hash, terms_accepted=False):
+        """
+        Create the account of the verified ``pending`` signup, with the
+        ``password_hash`` waited for, and log it in. ``terms_accepted`` is
+        for terms accepted on the code form, after the signup was staged.
+        Returns the id of the new user; raises UserError or SignupError when
+        the signup is refused.
+
+        The account is created by ``do_signup``, which stores the pending
+        hash and logs in with a ticket instead of hashing and checking the
+        password again (see ResUsers). ``web_auth_signup`` is not used: it
+        ends by replaying ``web_login`` with the form's password, here the
+        placeholder, and fails once the account exists.
+        """
+        login = pending.email
+        request.update_context(
+            otp_pending_signup_id=pending.id,
+            otp_pending_password_hash=password_hash,
+            otp_pending_terms_accepted=terms_accepted,
+        )
+        self.do_signup({
+            'login': login,
+            'name': pending.name,
+            'password': OTP_SIGNUP_PASSWORD,
+            'confirm_password': OTP_SIGNUP_PASSWORD,
+        })
+        request.session.pop(OTP_SIGNUP_SESSION_KEY, None)
+        uid = request.session.uid
+        if uid is None:
+            # Logged in pending a second factor (MFA)
+            uid = request.session.pre_uid
+            request.update_env(user=request.env.ref('base.public_user'))
+        self._send_account_created_email(login)
+        request.params['login_success'] = True
+        return uid
+
+    def _otp_signup_complete(self, email, otp_input, terms_accepted=False):
+        """
+        Verify the code of ``email`` and create the account of its pending
+        signup, logged in. Returns the payload of the JSON route: ``status``
+        and the ``redirect`` URL, or an ``error`` code (``invalid_code``,
+        ``expired``, ``signup_failed``) and its ``message``.
+        """
+        # Before the code is used up: a signup that can not complete must
+        # not cost the user their code.
+        pending = request.env['otp.signup.pending'].sudo()._get_pending(email, self._otp_signup_nonce())
+        password_hash = pending._wait_password_hash() if pending else False
+        if not password_hash:
+            return {
+                "status": "error", "error": "expired",
+                "message": _("Your signup has expired, please fill in the form again."),
+            }
+
+        with metrics.timed("signup", "verify"):
+            state = get_otp_store(request.env).verify(email, otp_input)
+        metrics.count("signup", state or "rejected")
+        if state != 'verified':
+            return {
+                "status": "error", "error": "invalid_code",
+                "message": _("The OTP you entered is invalid. Please try again."),
+            }
+        _logger.info("OTP verified successfully for email %s", email)
+
+        try:
+            with metrics.timed("signup", "account_creation"):
+                uid = self._otp_signup_create_account(pending, password_hash, terms_accepted)
+        except (UserError, SignupError) as e:
+            _logger.error("Error creating the account of OTP signup %s: %s", email, e)
+            return {"status": "error", "error": "signup_failed", "message": e.args[0]}
+        return {"status": "success", "redirect": local_url(self._login_redirect(uid))}
+
     @http.route('/web/signup/otp/verify', type='http', auth='public', website=True, sitemap=False)
     def web_otp_signup_verify(self, *args, **kw):
         qcontext = request.params.copy()
         qcontext['providers'] = self._get_oauth_providers()
 
         email = str(qcontext.get('login'))
-        otp_input = str(qcontext.get('otp'))
-        password = qcontext.get('password')
-        confirm_password = qcontext.get('confirm_password')
+        result = self._otp_signup_complete(email, str(qcontext.get('otp')), bool(qcontext.get("terms_conditions")))
+        if result["status"] == "success":
+            return request.redirect(result["redirect"])
+
+        if result["error"] == "invalid_code":
+            return request.render('otp_login.custom_otp_signup', {
+                'otp': True,
+                'otp_login': True,
+                'login': email,
+                'name': qcontext.get("name"),
+                'otp_error': True,
+                'providers': qcontext['providers'],
+            })
+        return request.render('otp_login.custom_otp_signup', {
+            'login': email,
+            'name': qcontext.get("name"),
+            'error': result["message"],
+            'providers': qcontext['providers'],
+        })
 
-        res_id = request.env['otp.verification'].sudo().search(
-            [('email', '=', email)], order="create_date desc", limit=1
+    @http.route('/web/signup/otp/verify/json', type='json', auth='public', website=True, csrf=False)
+    def web_otp_signup_verify_json(self, **kw):
+        """``/web/signup/otp/verify`` for the signup page script: a status instead of a page."""
+        data = request.get_json_data() or {}
+        return self._otp_signup_complete(
+            str(data.get("login") or ""), str(data.get("otp") or ""), bool(data.get("terms_conditions")),
         )
-        otp_stored = res_id.otp if res_id else None
-
-        try:
-
-            if otp_stored and otp_input == otp_stored:
-                res_id.state = 'verified'
-                _logger.info("OTP verified successfully for email %s", email)
-
-                # 🔥 Save Terms Acceptance
-                kw["terms_accepted"] = True if qcontext.get("terms_conditions") else False
-
-                return self.web_auth_signup(*args, **kw)
-
-            # if otp_stored and otp_input == otp_stored:
-            #     res_id.state = 'verified'
-            #     _logger.info("OTP verified successfully for email %s", email)
-            #     return self.web_auth_signup(*args, **kw)
-            else:
-                if res_id:
-                    res_id.state = 'rejected'
-                return request.render('otp_login.custom_otp_signup', {
-                    'otp': True,
-                    'otp_login': True,
-                    'login': email,
-                    'name': qcontext.get("name"),
-                    'password': password,
-                    'confirm_password': confirm_password,
-                    'otp_error': True,
-                    'providers': self._get_oauth_providers(),
-                })
-
-        except UserError as e:
-            qcontext['error'] = e.name or e.value
-            _logger.error("UserError during OTP verification: %s", e)
-
-        return request.render('otp_login.custom_otp_signup', qcontext)
 
 
 
@@ -218,22 +344,17 @@ class OtpSignupHome(AuthSignupHome):
         if not email:
             return {"status": "error", "message": "Missing email"}
 
+        retry_after = self._otp_retry_after(email)
+        if retry_after:
+            request.future_response.headers["Retry-After"] = str(retry_after)
+            return {"status": "error", "message": self._otp_throttled_message(retry_after), "retry_after": retry_after}
 
-        # user_id = request.env['res.users'].sudo().search([('login', '=', email)], limit=1)
-
-        # Generate OTP
-        OTP = self.generate_otp(4)
-        print(f"Here is your otp: {OTP}")
-        _logger.info(f"Resent OTP for {email}: {OTP}")
-
-        # Save OTP
-        request.env['otp.verification'].sudo().create({
-            "otp": OTP,
-            "email": email
-        })
-
-        
-        self._send_otp_email(email, name, otp_code=OTP)
+        with metrics.timed("signup", "user_lookup"):
+            existing = request.env['res.users'].sudo().search_count([('login', '=', email)], limit=1)
+        if existing:
+            return {"status": "error", "message": "Another user is already registered using this email address."}
 
+        if not self._issue_signup_otp(email, name):
+            return {"status": "success", "message": "An OTP was sent a few seconds ago, please check your inbox."}
         return {"status": "success", "message": "OTP resent successfully"}
 
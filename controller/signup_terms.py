@@ -15,8 +15,6 @@ class OTPAuthSignup(AuthSignupHome):
                 "error": "You must accept the Terms & Conditions to proceed.",
                 "login": kwargs.get("login"),
                 "name": kwargs.get("name"),
-                "password": kwargs.get("password"),
-                "confirm_password": kwargs.get("confirm_password"),
             })
 
         # Continue normal OTP logic
@@ -0,0 +1,16 @@
+# -*- coding: utf-8 -*-
+import logging
+
+_logger = logging.getLogger(__name__)
+
+
+def migrate(cr, version):
+    """
+    Codes are stored as keyed digests from 0.2 on. The plaintext codes can
+    not be carried over, so the rows holding them are dropped along with the
+    column: a user waiting on a code issued before the upgrade asks for a new
+    one.
+    """
+    cr.execute("DELETE FROM otp_verification")
+    _logger.info("Removed %s OTP row(s) stored in plaintext", cr.rowcount)
+    cr.execute("ALTER TABLE otp_verification DROP COLUMN IF EXISTS otp")
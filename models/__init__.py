@@ -1,2 +1,8 @@
 from . import otp_verification
+from . import otp_signup_pending
+from . import otp_trusted_device
 from . import res_users
+from . import mail_mail
+from . import website
+from . import res_company
+from . import auth_oauth_provider
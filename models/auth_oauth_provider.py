@@ -0,0 +1,35 @@
+from odoo import api, models, tools
+from odoo.addons.auth_oauth.controllers.main import OAuthLogin
+
+
+class AuthOAuthProvider(models.Model):
+    _inherit = "auth.oauth.provider"
+
+    @api.model
+    @tools.ormcache("website_id", "self.env.lang", "url_root")
+    def _otp_signup_providers(self, website_id, url_root):
+        """
+        Providers shown on the OTP signup pages, with their login links.
+
+        Cached per website, language and host until a provider changes.
+        Only valid for requests without a ``redirect`` or signup ``token``
+        parameter, which end up in the links. Callers must not mutate the
+        returned dicts.
+        """
+        return tuple(OAuthLogin().list_providers())
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        providers = super().create(vals_list)
+        self.env.registry.clear_cache()
+        return providers
+
+    def write(self, vals):
+        res = super().write(vals)
+        self.env.registry.clear_cache()
+        return res
+
+    def unlink(self):
+        res = super().unlink()
+        self.env.registry.clear_cache()
+        return res
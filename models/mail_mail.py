@@ -0,0 +1,102 @@
+import logging
+
+from odoo import fields, models, api
+from odoo.tools.sql import create_index
+
+from odoo.addons.otp_login.utils.otp_transport import get_otp_transport
+
+_logger = logging.getLogger(__name__)
+
+OTP_MAIL_BATCH_SIZE = 50
+
+
+class MailMail(models.Model):
+    _inherit = "mail.mail"
+
+    is_otp = fields.Boolean(string="OTP Mail", default=False, copy=False)
+
+    def init(self):
+        super().init()
+        # The OTP sender only ever looks at pending OTP mails.
+        create_index(
+            self.env.cr,
+            "mail_mail_otp_outgoing_idx",
+            self._table,
+            ["id"],
+            where="is_otp AND state = 'outgoing'",
+        )
+
+    # -------------------------------------------------------------------------
+    # DISPATCH
+    # -------------------------------------------------------------------------
+    @api.model
+    def _otp_dispatch_mode(self):
+        """'sync' sends within the request, 'queued' hands over to the OTP sender."""
+        mode = self.env["ir.config_parameter"].sudo().get_param("otp_login.mail_dispatch", "sync")
+        return "queued" if mode == "queued" else "sync"
+
+    @api.model
+    def _otp_dispatch(self, values):
+        """
+        Create an OTP mail from ``values`` and deliver it.
+
+        In queued mode the mail is only stored and the OTP sender cron is
+        triggered, so the HTTP request does not wait on SMTP.
+        """
+        mail = self.sudo().create(dict(values, is_otp=True))
+        if self._otp_dispatch_mode() == "queued":
+            self.env.ref("otp_login.ir_cron_otp_mail_dispatch").sudo()._trigger()
+        else:
+            get_otp_transport(self.env).deliver(mail)
+        return mail
+
+    @api.model
+    def process_email_queue(self, email_ids=None, batch_size=1000):
+        """
+        Leave pending OTP mails to the OTP sender: the generic mail scheduler
+        reads the same outgoing rows without locking them, so both crons
+        could send an OTP mail.
+        """
+        filters = list(self.env.context.get("filters") or []) + [("is_otp", "=", False)]
+        return super(MailMail, self.with_context(filters=filters)).process_email_queue(
+            email_ids=email_ids, batch_size=batch_size,
+        )
+
+    @api.model
+    def _otp_mail_queue_stats(self):
+        """Return the number of pending OTP mails and the age of the oldest one."""
+        self.env.cr.execute("""
+            SELECT COUNT(*), EXTRACT(EPOCH FROM (now() at time zone 'UTC') - MIN(create_date))
+              FROM mail_mail
+             WHERE is_otp AND state = 'outgoing'
+        """)
+        depth, oldest = self.env.cr.fetchone()
+        return {"depth": depth, "oldest_age": float(oldest or 0.0)}
+
+    @api.model
+    def _cron_send_otp_mail(self):
+        """Send pending OTP mails ahead of the regular mail queue."""
+        ICP = self.env["ir.config_parameter"].sudo()
+        batch_size = max(1, int(ICP.get_param("otp_login.mail_batch_size", OTP_MAIL_BATCH_SIZE)))
+        stats = self._otp_mail_queue_stats()
+        # Claim the batch: mails locked by another sender are left to it.
+        self.env.cr.execute("""
+            SELECT id FROM mail_mail
+             WHERE is_otp AND state = 'outgoing'
+             ORDER BY id
+             LIMIT %s
+               FOR UPDATE SKIP LOCKED
+        """, [batch_size])
+        mails = self.sudo().browse([row[0] for row in self.env.cr.fetchall()])
+        if not mails:
+            return 0
+        now = fields.Datetime.now()
+        latencies = [(now - mail.create_date).total_seconds() for mail in mails]
+        get_otp_transport(self.env).deliver(mails, auto_commit=True)
+        _logger.info(
+            "OTP sender: sent %s mail(s), queue depth %s, wait max %.2fs avg %.2fs",
+            len(mails), stats["depth"], max(latencies), sum(latencies) / len(latencies),
+        )
+        remaining = max(stats["depth"] - len(mails), 0)
+        self.env["ir.cron"]._notify_progress(done=len(mails), remaining=remaining)
+        return len(mails)
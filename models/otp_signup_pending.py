@@ -0,0 +1,137 @@
+import logging
+import threading
+import time
+
+from odoo import api, fields, models
+from datetime import timedelta
+
+from odoo.addons.otp_login.utils.otp_store import normalize_email
+
+_logger = logging.getLogger(__name__)
+
+PENDING_RETENTION_MINUTES = 60
+HASH_WAIT_SECONDS = 5
+
+
+class OtpSignupPending(models.Model):
+    """
+    Signup waiting for its OTP to be verified.
+
+    The password never leaves the server once posted: it is hashed in a
+    background thread while the user reads the email, and only the hash is
+    stored. The account is created from this record when the code is
+    verified, see ``res.users._create_user_from_template``.
+
+    A pending signup belongs to the browser session that posted it
+    (``session_nonce``) and is only ever found through it: anyone can
+    request a code for any email, but not replace the name and password of
+    somebody else's signup.
+    """
+    _name = "otp.signup.pending"
+    _description = "Pending OTP Signup"
+
+    email = fields.Char(string="Email", required=True, index=True)
+    name = fields.Char(string="Name")
+    password_hash = fields.Char(string="Password Hash", copy=False)
+    terms_accepted = fields.Boolean(string="Terms Accepted")
+    session_nonce = fields.Char(string="Session Nonce", index=True, copy=False)
+
+    @api.model
+    def _stage(self, email, name, password, session_nonce, terms_accepted=False):
+        """
+        Replace the pending signup of the session ``session_nonce`` and start
+        hashing ``password`` once the request is committed.
+        """
+        self.env.cr.execute("DELETE FROM otp_signup_pending WHERE session_nonce = %s", [session_nonce])
+        self.invalidate_model()
+        pending = self.create({
+            "email": normalize_email(email),
+            "name": name,
+            "terms_accepted": terms_accepted,
+            "session_nonce": session_nonce,
+        })
+        # Resolved in the request: the thread must not touch its environment.
+        crypt_context = self.env["res.users"]._crypt_context()
+        registry = self.env.registry
+        self.env.cr.postcommit.add(lambda: threading.Thread(
+            target=self._hash_password, args=(registry, pending.id, crypt_context, password),
+            name=f"otp_signup_hash_{pending.id}", daemon=True,
+        ).start())
+        return pending
+
+    @staticmethod
+    def _hash_password(registry, pending_id, crypt_context, password):
+        try:
+            password_hash = crypt_context.hash(password)
+            with registry.cursor() as cr:
+                cr.execute(
+                    "UPDATE otp_signup_pending SET password_hash = %s WHERE id = %s",
+                    [password_hash, pending_id],
+                )
+        except Exception:
+            _logger.exception("Hashing the password of pending signup %s failed", pending_id)
+            # Without its hash the signup can not complete: drop it, so the
+            # verification does not wait for it and asks for the form again.
+            with registry.cursor() as cr:
+                cr.execute("DELETE FROM otp_signup_pending WHERE id = %s", [pending_id])
+
+    @api.model
+    def _get_pending(self, email, session_nonce):
+        """Pending signup of ``email`` posted by the session ``session_nonce``."""
+        if not session_nonce:
+            return self.browse()
+        return self.search([
+            ("session_nonce", "=", session_nonce),
+            ("email", "=", normalize_email(email)),
+        ], limit=1)
+
+    def _wait_password_hash(self, timeout=HASH_WAIT_SECONDS):
+        """
+        Return the password hash, waiting up to ``timeout`` seconds for the
+        background thread, or False when it failed or never ran.
+
+        Polled on a cursor of its own: the request's snapshot does not see
+        a hash committed after it started, so the hash must be used as
+        returned, and the record neither written nor deleted in this
+        transaction (see :meth:`_unlink_after_commit`).
+        """
+        self.ensure_one()
+        if self.password_hash:
+            return self.password_hash
+        deadline = time.monotonic() + timeout
+        with self.env.registry.cursor() as cr:
+            while True:
+                cr.execute("SELECT password_hash FROM otp_signup_pending WHERE id = %s", [self.id])
+                row = cr.fetchone()
+                if not row or row[0] or time.monotonic() >= deadline:
+                    break
+                cr.rollback()  # new snapshot for the next poll
+                time.sleep(0.1)
+        return row[0] if row else False
+
+    def _unlink_after_commit(self):
+        """
+        Delete the records once the current transaction is committed, on a
+        cursor of its own: the hashing thread may have updated them after
+        this transaction's snapshot, and deleting them here would fail to
+        serialize. If the transaction rolls back, they are kept.
+        """
+        ids = tuple(self.ids)
+        registry = self.env.registry
+
+        @self.env.cr.postcommit.add
+        def unlink():
+            with registry.cursor() as cr:
+                cr.execute("DELETE FROM otp_signup_pending WHERE id IN %s", [ids])
+
+    @api.model
+    def _purge_stale(self):
+        ICP = self.env["ir.config_parameter"].sudo()
+        minutes = int(ICP.get_param("otp_login.signup_pending_minutes", PENDING_RETENTION_MINUTES))
+        self.env.cr.execute(
+            "DELETE FROM otp_signup_pending WHERE create_date < %s",
+            [fields.Datetime.now() - timedelta(minutes=minutes)],
+        )
+        deleted = self.env.cr.rowcount
+        self.invalidate_model()
+        return deleted
@@ -0,0 +1,81 @@
+import secrets
+
+from odoo import api, fields, models
+from odoo.tools.misc import hmac as odoo_hmac
+from datetime import timedelta
+
+TRUSTED_DEVICE_COOKIE = "otp_trusted_device"
+TRUSTED_DEVICE_SCOPE = "otp_login.trusted_device"
+
+
+class OtpTrustedDevice(models.Model):
+    """
+    Browser allowed to log its user in without an OTP.
+
+    The browser keeps a random token in the ``otp_trusted_device`` cookie and
+    only its HMAC is stored, so the table can not be used to log in. The
+    digest is unique: checking a token is a single index lookup.
+    """
+    _name = "otp.trusted.device"
+    _description = "OTP Trusted Device"
+
+    user_id = fields.Many2one("res.users", string="User", required=True, index=True, ondelete="cascade")
+    token_digest = fields.Char(string="Token Digest", size=64, required=True, copy=False)
+    expires_at = fields.Datetime(string="Expires At", required=True)
+    user_agent = fields.Char(string="Browser")
+
+    _sql_constraints = [
+        ("token_digest_unique", "UNIQUE(token_digest)", "A trusted device token can only be used once."),
+    ]
+
+    @api.model
+    def _lifetime_days(self):
+        """``otp_login.trusted_device_days``, 0 when devices can not be trusted."""
+        ICP = self.env["ir.config_parameter"].sudo()
+        return int(ICP.get_param("otp_login.trusted_device_days", 0))
+
+    @api.model
+    def _digest(self, token):
+        return odoo_hmac(self.env(su=True), TRUSTED_DEVICE_SCOPE, token)
+
+    @api.model
+    def _issue(self, user, days, user_agent=None):
+        """Trust the current browser of ``user`` for ``days``, return the token of its cookie."""
+        token = secrets.token_urlsafe(32)
+        self.create({
+            "user_id": user.id,
+            "token_digest": self._digest(token),
+            "expires_at": fields.Datetime.now() + timedelta(days=days),
+            "user_agent": (user_agent or "")[:255],
+        })
+        return token
+
+    @api.model
+    def _check(self, token, login):
+        """User ``login`` when ``token`` is one of its live devices, else an empty recordset."""
+        Users = self.env["res.users"]
+        if not token or not self._lifetime_days():
+            return Users
+        device = self.search([
+            ("token_digest", "=", self._digest(token)),
+            ("expires_at", ">", fields.Datetime.now()),
+        ], limit=1)
+        user = device.user_id
+        return user if user.active and user.login == login else Users
+
+    @api.model
+    def _revoke(self, users):
+        """Forget every trusted device of ``users``, return how many."""
+        if not users:
+            return 0
+        self.env.cr.execute("DELETE FROM otp_trusted_device WHERE user_id IN %s", [tuple(users.ids)])
+        deleted = self.env.cr.rowcount
+        self.invalidate_model()
+        return deleted
+
+    @api.model
+    def _purge_expired(self):
+        self.env.cr.execute("DELETE FROM otp_trusted_device WHERE expires_at < %s", [fields.Datetime.now()])
+        deleted = self.env.cr.rowcount
+        self.invalidate_model()
+        return deleted
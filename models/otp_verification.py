@@ -1,11 +1,33 @@
+import logging
+import time
+
 from odoo import fields, models, api
+from odoo.tools import str2bool
+from odoo.tools.sql import create_index
 from datetime import datetime, timedelta
 
+from odoo.addons.otp_login.utils.otp_store import normalize_email, otp_digest
+
+_logger = logging.getLogger(__name__)
+
+# Default retention per state, in minutes, counted from ``sent_at``. Each one
+# can be overridden with the ``otp_login.retention_<state>_minutes`` system
+# parameter.
+PURGE_RETENTION_MINUTES = {
+    "verified": 60,
+    "rejected": 24 * 60,
+    "unverified": 24 * 60,
+}
+PURGE_BATCH_SIZE = 1000
+PURGE_TIME_BUDGET = 60  # seconds
+
+
 class OtpVerification(models.Model):
     _name = "otp.verification"
     _description = 'Otp Verification'
 
-    otp = fields.Text(string="OTP")
+    # HMAC of the code (see ``otp_digest``), the code itself is never stored.
+    otp_digest = fields.Char(string="OTP Digest", size=64, copy=False)
     state = fields.Selection([
             ('verified', 'Verified'),
             ('unverified', 'Unverified'),
@@ -13,9 +35,210 @@ class OtpVerification(models.Model):
     email = fields.Char(string="email")
 
     sent_at = fields.Datetime(string="Sent At", default=fields.Datetime.now)
+    resend_count = fields.Integer(string="Resends", default=0, copy=False)
+
+    def init(self):
+        # Only live (unverified) codes are ever looked up by email, so keep
+        # the index small by leaving consumed rows out of it.
+        create_index(
+            self.env.cr,
+            "otp_verification_email_live_idx",
+            self._table,
+            ["email", "create_date DESC", "id DESC"],
+            where="state = 'unverified'",
+        )
+        create_index(
+            self.env.cr,
+            "otp_verification_state_sent_at_idx",
+            self._table,
+            ["state", "sent_at"],
+        )
+        self._apply_storage_mode()
+
+    def _apply_storage_mode(self):
+        """
+        Make the table UNLOGGED when ``otp_login.unlogged_storage`` is set,
+        LOGGED otherwise. Applied on install and upgrade: change the
+        parameter, then upgrade the module.
+
+        An UNLOGGED table skips the WAL, so it is not replicated to standbys
+        and is emptied after a crash of the database server; the codes in
+        flight are lost and have to be requested again.
+        """
+        cr = self.env.cr
+        ICP = self.env["ir.config_parameter"].sudo()
+        unlogged = str2bool(ICP.get_param("otp_login.unlogged_storage", "False"), False)
+        cr.execute("SELECT relpersistence FROM pg_class WHERE oid = %s::regclass", [self._table])
+        if (cr.fetchone()[0] == "u") == unlogged:
+            return
+        mode = "UNLOGGED" if unlogged else "LOGGED"
+        _logger.info("Switching table %s to %s", self._table, mode)
+        # Rewrites the table under an exclusive lock; it only holds live codes.
+        cr.execute(f'ALTER TABLE "{self._table}" SET {mode}')
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        for vals in vals_list:
+            if vals.get("email"):
+                vals["email"] = normalize_email(vals["email"])
+        # A new code supersedes any code still live for the same email, so
+        # there is at most one usable OTP per address at any time.
+        emails = list({vals["email"] for vals in vals_list if vals.get("email")})
+        if emails:
+            self.flush_model(["email", "state"])
+            self.env.cr.execute("""
+                UPDATE otp_verification
+                   SET state = 'rejected'
+                 WHERE email = ANY(%s) AND state = 'unverified'
+            """, [emails])
+            self.invalidate_model(["state"])
+        return super().create(vals_list)
+
+    @api.model
+    def _coalesce_resend(self, email, window):
+        """
+        Count a resend of the live code of ``email`` if it was sent less
+        than ``window`` seconds ago, in a single UPDATE on the live index.
+
+        Returns the new resend count, or 0 when there is no such code.
+        """
+        self.flush_model(["email", "state", "sent_at", "resend_count"])
+        self.env.cr.execute("""
+            UPDATE otp_verification
+               SET resend_count = COALESCE(resend_count, 0) + 1
+             WHERE email = %s AND state = 'unverified' AND sent_at >= %s
+         RETURNING resend_count
+        """, [email, fields.Datetime.now() - timedelta(seconds=window)])
+        row = self.env.cr.fetchone()
+        self.invalidate_model(["resend_count"])
+        return row[0] if row else 0
 
     @api.model
-    def _cron_delete_verified_otp(self):
-        otp = self.search([('state', '=', 'verified')])
-        otp.unlink()
+    def _verify_and_consume(self, email, otp, lifetime=None):
+        """
+        Check ``otp`` against the live code of ``email`` and consume it in a
+        single ``UPDATE ... RETURNING`` statement.
 
+        Only digests are compared. PostgreSQL's ``=`` is not constant-time,
+        but what it could leak is a prefix of a keyed HMAC, which says
+        nothing about the code without the database secret.
+
+        The code is marked 'verified' on a match and 'rejected' otherwise,
+        either way it can not be submitted again. Two concurrent submits can
+        not both pass: the second one waits on the row lock and then no
+        longer matches ``state = 'unverified'``. A code older than
+        ``lifetime`` minutes is rejected without being compared.
+
+        Returns 'verified', 'rejected' or 'expired', or False when no live
+        code exists for email.
+        """
+        cutoff = fields.Datetime.now() - timedelta(minutes=lifetime) if lifetime else None
+        email = normalize_email(email)
+        digest = otp_digest(self.env, email, otp)
+        self.flush_model(["email", "otp_digest", "state", "sent_at"])
+        self.env.cr.execute("""
+            WITH live AS (
+                SELECT id, (%(cutoff)s::timestamp IS NOT NULL AND sent_at < %(cutoff)s::timestamp) AS expired
+                  FROM otp_verification
+                 WHERE email = %(email)s AND state = 'unverified'
+              ORDER BY create_date DESC, id DESC
+                 LIMIT 1
+            )
+            UPDATE otp_verification o
+               SET state = CASE WHEN o.otp_digest = %(digest)s AND NOT live.expired THEN 'verified' ELSE 'rejected' END,
+                   write_uid = %(uid)s,
+                   write_date = (now() at time zone 'UTC')
+              FROM live
+             WHERE o.id = live.id AND o.state = 'unverified'
+         RETURNING o.state, live.expired
+        """, {"digest": digest, "email": email, "uid": self.env.uid, "cutoff": cutoff})
+        row = self.env.cr.fetchone()
+        self.invalidate_model(["state", "write_uid", "write_date"])
+        if not row:
+            return False
+        state, expired = row
+        return "expired" if expired else state
+
+    # -------------------------------------------------------------------------
+    # PURGE
+    # -------------------------------------------------------------------------
+    @api.model
+    def _get_purge_retention(self):
+        """Return {state: retention in minutes} from the system parameters."""
+        ICP = self.env["ir.config_parameter"].sudo()
+        retention = {}
+        for state, default in PURGE_RETENTION_MINUTES.items():
+            value = ICP.get_param(f"otp_login.retention_{state}_minutes", default)
+            try:
+                retention[state] = max(int(value), 0)
+            except (TypeError, ValueError):
+                _logger.warning("Invalid OTP retention %r for state %s, using %s", value, state, default)
+                retention[state] = default
+        return retention
+
+    @api.model
+    def _get_purge_setting(self, name, default):
+        """Positive integer ``otp_login.<name>``, ``default`` when it is not a number."""
+        value = self.env["ir.config_parameter"].sudo().get_param(f"otp_login.{name}", default)
+        try:
+            return max(int(value), 1)
+        except (TypeError, ValueError):
+            _logger.warning("Invalid OTP purge setting %s=%r, using %s", name, value, default)
+            return default
+
+    @api.model
+    def _purge_expired(self, batch_size=PURGE_BATCH_SIZE, time_budget=PURGE_TIME_BUDGET, commit=False):
+        """
+        Delete OTP rows older than the retention of their state.
+
+        Rows are removed in batches of ``batch_size`` with plain SQL. Rows
+        locked by a concurrent verify are skipped and picked up by the next
+        run. With ``commit`` set, every batch is committed on its own so no
+        lock is held longer than one batch.
+
+        Returns (deleted, done): the number of rows removed and whether
+        everything eligible was removed before ``time_budget`` ran out.
+        """
+        self.flush_model()
+        cr = self.env.cr
+        deadline = time.monotonic() + time_budget
+        now = fields.Datetime.now()
+        deleted = 0
+        for state, minutes in self._get_purge_retention().items():
+            cutoff = now - timedelta(minutes=minutes)
+            while True:
+                cr.execute("""
+                    DELETE FROM otp_verification
+                     WHERE id IN (
+                        SELECT id FROM otp_verification
+                         WHERE state = %s AND sent_at < %s
+                         LIMIT %s
+                           FOR UPDATE SKIP LOCKED
+                     )
+                """, [state, cutoff, batch_size])
+                count = cr.rowcount
+                deleted += count
+                if commit:
+                    cr.commit()
+                if count < batch_size:
+                    break
+                if time.monotonic() >= deadline:
+                    self.invalidate_model()
+                    return deleted, False
+        self.invalidate_model()
+        return deleted, True
+
+    @api.model
+    def _cron_purge_otp(self):
+        # A batch of 0 would never finish a state (every DELETE removes
+        # nothing until the time budget runs out), a budget of 0 would stop
+        # every state after its first batch.
+        batch_size = self._get_purge_setting("purge_batch_size", PURGE_BATCH_SIZE)
+        time_budget = self._get_purge_setting("purge_time_budget", PURGE_TIME_BUDGET)
+        deleted, done = self._purge_expired(batch_size=batch_size, time_budget=time_budget, commit=True)
+        self.env["otp.signup.pending"]._purge_stale()
+        self.env["otp.trusted.device"]._purge_expired()
+        _logger.info("OTP purge removed %s row(s)%s", deleted, "" if done else ", more left for the next run")
+        # Ask the scheduler to run again right away when the budget ran out.
+        self.env["ir.cron"]._notify_progress(done=deleted, remaining=0 if done else 1)
+        return deleted
@@ -0,0 +1,43 @@
+from collections import namedtuple
+
+from odoo import models, tools
+
+# Everything the OTP emails need to know about the sending company. Cached
+# per company, so it must stay immutable.
+OtpBranding = namedtuple("OtpBranding", [
+    "company_id", "company_name", "email_from", "logo_url", "website", "phone", "base_url",
+])
+
+OTP_BRANDING_FIELDS = {"name", "email", "logo", "website", "phone", "partner_id"}
+
+
+class ResCompany(models.Model):
+    _inherit = "res.company"
+
+    @tools.ormcache("self.id")
+    def _get_otp_branding(self):
+        """
+        Return the OtpBranding of this company.
+
+        The result is cached until the company branding fields or a system
+        parameter (``web.base.url``) change, so sending an OTP does not read
+        the company, its logo or the base URL again.
+        """
+        self.ensure_one()
+        company = self.sudo()
+        base_url = self.env["ir.config_parameter"].sudo().get_param("web.base.url") or ""
+        return OtpBranding(
+            company_id=company.id,
+            company_name=company.name or "Your Company",
+            email_from=company.email or f"noreply@{base_url.split('//')[-1]}",
+            logo_url=f"{base_url}/web/image/res.company/{company.id}/logo" if company.logo else "",
+            website=company.website or "#",
+            phone=company.phone or "N/A",
+            base_url=base_url,
+        )
+
+    def write(self, vals):
+        res = super().write(vals)
+        if OTP_BRANDING_FIELDS.intersection(vals):
+            self.env.registry.clear_cache()
+        return res
@@ -1,30 +1,30 @@
 # -*- coding: utf-8 -*-
 from odoo import models, _, api, fields, SUPERUSER_ID
 from odoo.http import request
-from odoo.exceptions import ValidationError, AccessDenied
-import re
+from odoo.exceptions import ValidationError, AccessDenied, UserError
+from odoo.tools import split_every
+from odoo.addons.otp_login.utils.email_templates import render_otp_email
+from odoo.addons.otp_login.utils.otp_store import get_otp_store
+from odoo.addons.otp_login.utils.login_ticket import consume_login_ticket, issue_login_ticket
+from odoo.addons.otp_login.utils import metrics
+from odoo.addons.otp_login.utils.password_policy import PasswordPolicy
+from odoo.addons.otp_login.utils.otp_generator import get_otp_generator
 import logging
 import pytz
 
 _logger = logging.getLogger(__name__)
 
+OTP_BULK_CHUNK_SIZE = 500
 
-def _check_password_strength(password):
+
+def _check_password_strength(password, policy=None):
     """
     Validate password against complexity rules.
     Returns (bool, message) so caller knows what failed.
     """
-    if len(password) < 8:
-        return False, _("Password must be at least 8 characters long.")
-    if not re.search(r"[A-Z]", password):
-        return False, _("Password must contain at least one uppercase letter.")
-    if not re.search(r"[a-z]", password):
-        return False, _("Password must contain at least one lowercase letter.")
-    if not re.search(r"[0-9]", password):
-        return False, _("Password must contain at least one digit.")
-    if not re.search(r"[@$!%*?&]", password):
-        return False, _("Password must contain at least one special character (@, $, !, %, *, ?, &).")
-    return True, None
+    policy = policy or PasswordPolicy()
+    failures = policy.check(password)
+    return not failures, policy.message(failures)
 
 
 class ResUsers(models.Model):
@@ -38,6 +38,141 @@ class ResUsers(models.Model):
         help="Indicates whether the user accepted the Terms and Conditions during signup."
     )
 
+    # -------------------------------------------------------------------------
+    # PASSWORD POLICY
+    # -------------------------------------------------------------------------
+    @api.model
+    def _get_password_policy(self):
+        return PasswordPolicy.from_env(self.env)
+
+    @api.model
+    def _check_password_policy(self, passwords):
+        """
+        Validate many passwords at once (imports, admin resets).
+        Returns a list of (bool, message), in the order of ``passwords``.
+        """
+        policy = self._get_password_policy()
+        return [(not failures, policy.message(failures)) for failures in policy.check_many(passwords)]
+
+    # -------------------------------------------------------------------------
+    # OTP SIGNUP
+    # -------------------------------------------------------------------------
+    def _create_user_from_template(self, values):
+        """
+        With ``otp_pending_signup_id`` in context, create the user of that
+        verified pending signup: its password was hashed while the OTP was
+        on its way, so it is stored as is instead of being hashed again, and
+        the password returned by ``signup()`` to log the user in becomes a
+        one-shot login ticket.
+        """
+        pending_id = self.env.context.get("otp_pending_signup_id")
+        if not pending_id:
+            return super()._create_user_from_template(values)
+        pending = self.env["otp.signup.pending"].sudo().browse(pending_id)
+        # Waited for on another cursor (see _wait_password_hash): this
+        # transaction may not see it on the record.
+        password_hash = self.env.context.get("otp_pending_password_hash") or pending.password_hash
+        if not password_hash:
+            raise UserError(_("Your signup has expired, please fill in the form again."))
+        values.pop("password", None)
+        values["terms_accepted"] = pending.terms_accepted or self.env.context.get("otp_pending_terms_accepted", False)
+        user = super()._create_user_from_template(values)
+        self._set_encrypted_password(user.id, password_hash)
+        values["password"] = issue_login_ticket(self.env, user.id)
+        pending._unlink_after_commit()
+        return user
+
+    # -------------------------------------------------------------------------
+    # BULK RE-VERIFICATION
+    # -------------------------------------------------------------------------
+    @api.model
+    def _otp_bulk_issue(self, users, chunk_size=OTP_BULK_CHUNK_SIZE, commit=False):
+        """
+        Issue a login OTP to every user of ``users`` (a recordset or a domain)
+        and queue the emails for the OTP sender.
+
+        Users are handled ``chunk_size`` at a time: one batch of codes, one
+        bulk insert into the OTP store and one bulk ``mail.mail`` create per
+        chunk, all emails rendered from the same cached skeleton. With
+        ``commit`` set every chunk is committed, so a long run can be
+        followed (and resumed) from the log.
+
+        Returns the number of OTPs issued.
+        """
+        if not isinstance(users, models.BaseModel):
+            users = self.sudo().search(users)
+        users = users.filtered("login")
+        total = len(users)
+        if not total:
+            return 0
+
+        store = get_otp_store(self.env)
+        branding = self.env.company._get_otp_branding()
+        website = self.env["website"].get_current_website()
+        subject = f"[{branding.company_name}] Login Verification Code"
+        Mail = self.env["mail.mail"].sudo()
+
+        generator = get_otp_generator(self.env)
+        issued = 0
+        for chunk in split_every(chunk_size, users.ids, self.browse):
+            codes = list(zip(chunk.mapped("login"), generator.generate_many(len(chunk))))
+            store.issue_many(codes)
+            Mail.create([{
+                "subject": subject,
+                "email_from": branding.email_from,
+                "email_to": email,
+                "body_html": render_otp_email(
+                    "login", user.name, otp,
+                    branding.logo_url, branding.company_name, branding.phone, branding.website,
+                    view_look=website.otp_email_theme, lang=user.lang,
+                ),
+                "is_otp": True,
+            } for user, (email, otp) in zip(chunk, codes)])
+            issued += len(chunk)
+            if commit:
+                self.env.cr.commit()
+            _logger.info("OTP re-verification: %s/%s codes issued", issued, total)
+        self.env.ref("otp_login.ir_cron_otp_mail_dispatch").sudo()._trigger()
+        return issued
+
+    def action_otp_reverify(self):
+        """
+        Force the selected users to receive a fresh login OTP. Every chunk
+        is committed, so a large selection does not keep its codes locked
+        in one long transaction and its progress shows in the log.
+        """
+        issued = self.env["res.users"]._otp_bulk_issue(self, commit=True)
+        return {
+            "type": "ir.actions.client",
+            "tag": "display_notification",
+            "params": {
+                "type": "success",
+                "message": _("%s re-verification OTP(s) queued.", issued),
+                "sticky": False,
+            },
+        }
+
+    # -------------------------------------------------------------------------
+    # TRUSTED DEVICES
+    # -------------------------------------------------------------------------
+    def action_otp_revoke_trusted_devices(self):
+        """Make every browser of the selected users ask for an OTP again."""
+        revoked = self.env["otp.trusted.device"].sudo()._revoke(self)
+        return {
+            "type": "ir.actions.client",
+            "tag": "display_notification",
+            "params": {
+                "type": "success",
+                "message": _("%s trusted device(s) revoked.", revoked),
+                "sticky": False,
+            },
+        }
+
+    def _set_password(self):
+        # A new password also ends the trust given to the user's browsers.
+        super()._set_password()
+        self.env["otp.trusted.device"].sudo()._revoke(self)
+
     # -------------------------------------------------------------------------
     # LOGIN OVERRIDE
     # -------------------------------------------------------------------------
@@ -56,31 +191,35 @@ class ResUsers(models.Model):
             raise AccessDenied(_("Missing credentials."))
 
         try:
-            with cls.pool.cursor() as cr:
+            with metrics.timed("login", "authenticate"), cls.pool.cursor() as cr:
                 self = api.Environment(cr, SUPERUSER_ID, {})[cls._name]
 
                 with self._assert_can_auth():
-                    # ✅ MODIFIED: Search by login OR by partner username
-                    # First, try standard login
-                    user = self.search(self._get_login_domain(login_value), limit=1)
-                    
-                    # Fallback: If not found, check if it's a 'username' on Myfansbook website
-                    if not user and request and getattr(request, 'website', False) and \
-                       request.website.name == 'Myfansbook':
-                        
-                        partner = self.env['res.partner'].search([('username', '=', login_value)], limit=1)
-                        if partner:
-                            user = self.search([('partner_id', '=', partner.id)], limit=1)
+                    # OTP special case: the verify route already identified
+                    # the user and hands over a one-shot ticket.
+                    ticket_uid = consume_login_ticket(self.env, credential["password"])
+                    if ticket_uid:
+                        user = self.browse(ticket_uid)
+                        if user.login != login_value:
+                            user = self.browse()
+                    else:
+                        # ✅ MODIFIED: Search by login OR by partner username
+                        # First, try standard login
+                        user = self.search(self._get_login_domain(login_value), limit=1)
+
+                        # Fallback: If not found, check if it's a 'username' on Myfansbook website
+                        if not user and request and getattr(request, 'website', False) and \
+                           request.website.name == 'Myfansbook':
+
+                            partner = self.env['res.partner'].search([('username', '=', login_value)], limit=1)
+                            if partner:
+                                user = self.search([('partner_id', '=', partner.id)], limit=1)
 
                     if not user:
                         raise AccessDenied(_("User not found."))
 
                     user = user.with_user(user)
-                    cr.execute("SELECT COALESCE(password, '') FROM res_users WHERE id=%s", [user.id])
-                    hashed = cr.fetchone()[0]
-
-                    # OTP special case
-                    if credential["password"] != hashed + "mobile_otp_login":
+                    if not ticket_uid:
                         user._check_credentials(credential, user_agent_env)
 
                     # Update TZ and Last Login
@@ -217,7 +356,7 @@ class ResUsers(models.Model):
 # # -*- coding: utf-8 -*-
 # from odoo import models, _, api, fields, SUPERUSER_ID
 # from odoo.http import request
-# from odoo.exceptions import ValidationError, AccessDenied
+# from odoo.exceptions import ValidationError, AccessDenied, UserError
 # import re
 # import logging
 # import pytz
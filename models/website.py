@@ -0,0 +1,15 @@
+from odoo import fields, models
+
+from odoo.addons.otp_login.utils.email_templates import EMAIL_THEME_SELECTION, DEFAULT_EMAIL_THEME
+
+
+class Website(models.Model):
+    _inherit = "website"
+
+    otp_email_theme = fields.Selection(
+        EMAIL_THEME_SELECTION,
+        string="OTP Email Theme",
+        default=DEFAULT_EMAIL_THEME,
+        required=True,
+        help="Look of the login and signup OTP emails sent from this website.",
+    )
@@ -82,9 +82,98 @@ whenReady(() => {
 
         // Auto-start countdown when OTP form is shown
     const otpForm = document.querySelector("#form_otp");
-    if (otpForm) {
+    if (otpForm && !otpForm.classList.contains("d-none")) {
         startCountdown(30);
     }
 
+    // Both steps go through the JSON routes and update the page in place;
+    // a failed call falls back to the regular form post.
+    async function postJson(url, payload) {
+        const response = await fetch(url, {
+            method: "POST",
+            headers: { "Content-Type": "application/json" },
+            body: JSON.stringify(payload),
+        });
+        const raw = await response.json();
+        if (raw.error) {
+            throw new Error(raw.error.message || "Request failed");
+        }
+        return raw.result || raw;
+    }
+
+    function showMessage(form, message) {
+        let alertEl = form.querySelector(".o_otp_message");
+        if (!alertEl) {
+            alertEl = document.createElement("p");
+            alertEl.className = "alert alert-danger mt-2 o_otp_message";
+            alertEl.setAttribute("role", "alert");
+            form.querySelector(".oe_login_buttons").before(alertEl);
+        }
+        alertEl.textContent = message;
+        alertEl.classList.toggle("d-none", !message);
+    }
+
+    const emailForm = document.querySelector("#form_otp_login");
+    if (emailForm && otpForm) {
+        emailForm.addEventListener("submit", async function (ev) {
+            ev.preventDefault();
+            const email = emailForm.querySelector("input[name='login']").value.trim();
+            let data;
+            try {
+                data = await postJson("/web/otp/login/json", {
+                    login: email,
+                    redirect: params.get("redirect"),
+                });
+            } catch (err) {
+                console.error("Error sending OTP:", err);
+                emailForm.submit();
+                return;
+            }
+            if (data.status !== "success") {
+                showMessage(emailForm, data.message);
+                return;
+            }
+            if (data.redirect) {
+                // Trusted device: logged in without a code
+                window.location.assign(data.redirect);
+                return;
+            }
+            showMessage(emailForm, "");
+            document.querySelector("#otp_login_hidden").value = email;
+            emailForm.classList.add("d-none");
+            otpForm.classList.remove("d-none");
+            otpForm.querySelector("#otp").focus();
+            startCountdown(30);
+        });
+    }
+
+    if (otpForm) {
+        otpForm.addEventListener("submit", async function (ev) {
+            ev.preventDefault();
+            const otpInput = otpForm.querySelector("#otp");
+            let data;
+            try {
+                data = await postJson("/web/otp/verify/json", {
+                    login: document.querySelector("#otp_login_hidden").value,
+                    otp: otpInput.value.trim(),
+                    remember: Boolean(otpForm.querySelector("#otp_remember")?.checked),
+                    redirect: params.get("redirect"),
+                });
+            } catch (err) {
+                console.error("Error verifying OTP:", err);
+                otpForm.submit();
+                return;
+            }
+            if (data.status === "success") {
+                window.location.assign(data.redirect);
+                return;
+            }
+            otpInput.classList.add("is-invalid");
+            otpInput.value = "";
+            otpInput.focus();
+            showMessage(otpForm, data.message);
+        });
+    }
+
 });
 
@@ -100,11 +100,61 @@ whenReady(() => {
             otpForm.addEventListener("submit", function (ev) {
                 if (!termsCheckbox.checked) {
                     ev.preventDefault();
+                    ev.stopImmediatePropagation();
                     alert("You must agree to the Terms of Service and Privacy Policy.");
                     submitBtn.disabled = true;
                 }
             });
         }
+
+        // Verify through the JSON route and stay on the page when the code
+        // is wrong; a failed call falls back to the regular form post.
+        otpForm.addEventListener("submit", async function (ev) {
+            ev.preventDefault();
+            const otpInput = otpForm.querySelector("#otp");
+            let data;
+            try {
+                const response = await fetch("/web/signup/otp/verify/json", {
+                    method: "POST",
+                    headers: { "Content-Type": "application/json" },
+                    body: JSON.stringify({
+                        login: otpForm.querySelector("input[name='login']").value,
+                        otp: otpInput.value.trim(),
+                        terms_conditions: !termsCheckbox || termsCheckbox.checked,
+                    }),
+                });
+                const raw = await response.json();
+                if (raw.error) {
+                    throw new Error(raw.error.message || "Request failed");
+                }
+                data = raw.result || raw;
+            } catch (err) {
+                console.error("Error verifying OTP:", err);
+                otpForm.submit();
+                return;
+            }
+
+            if (data.status === "success") {
+                localStorage.removeItem(COUNTDOWN_KEY);
+                window.location.assign(data.redirect);
+                return;
+            }
+            let alertEl = otpForm.querySelector(".o_otp_message");
+            if (!alertEl) {
+                alertEl = document.createElement("p");
+                alertEl.className = "alert alert-danger mt-2 o_otp_message";
+                alertEl.setAttribute("role", "alert");
+                otpForm.querySelector(".oe_login_buttons").before(alertEl);
+            }
+            alertEl.textContent = data.message;
+            if (data.error === "invalid_code") {
+                otpInput.value = "";
+                otpInput.focus();
+            } else if (submitBtn) {
+                // Expired or refused signup: the form has to be filled in again.
+                submitBtn.disabled = true;
+            }
+        });
         if (!localStorage.getItem(COUNTDOWN_KEY)) {
             const expiry = Date.now() + 30 * 1000;
             localStorage.setItem(COUNTDOWN_KEY, expiry);
@@ -0,0 +1,4 @@
+from . import test_page_cache
+from . import test_query_budget
+from . import test_otp_transport
+from . import test_redis_backend
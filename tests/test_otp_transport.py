@@ -0,0 +1,75 @@
+import importlib.util
+import os
+import socket
+from unittest.mock import patch
+
+from odoo.tests import TransactionCase, tagged
+
+from odoo.addons.otp_login.utils import otp_transport
+
+_SINK = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "benchmarks", "smtp_sink.py")
+_spec = importlib.util.spec_from_file_location("smtp_sink", _SINK)
+smtp_sink = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(smtp_sink)
+
+
+@tagged("post_install", "-at_install")
+class TestOtpPooledTransport(TransactionCase):
+    """OTP mails sent through ``mail.mail`` and the SMTP pool to a local sink."""
+
+    def setUp(self):
+        super().setUp()
+        self.sink = smtp_sink.SmtpSink().start()
+        self.addCleanup(self.sink.stop)
+        self.addCleanup(self._close_pools)
+        ICP = self.env["ir.config_parameter"].sudo()
+        ICP.set_param("otp_login.mail_dispatch", "sync")
+        ICP.set_param("otp_login.mail_transport", "pooled")
+        # Test mode skips every SMTP call: talk to the sink for real.
+        patcher = patch.object(type(self.env["ir.mail_server"]), "_is_test_mode", lambda self: False)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _close_pools(self):
+        for pool in list(otp_transport._pools.values()):
+            pool.close()
+
+    def _mail_server(self, port):
+        return self.env["ir.mail_server"].create({
+            "name": "OTP sink", "smtp_host": "127.0.0.1", "smtp_port": port,
+            "smtp_encryption": "none", "from_filter": False,
+        })
+
+    def _dispatch(self, server, email_to):
+        return self.env["mail.mail"]._otp_dispatch({
+            "subject": "Login Verification Code", "body_html": "<p>Your code is 4242</p>",
+            "email_from": "noreply@example.com", "email_to": email_to, "mail_server_id": server.id,
+        })
+
+    def test_connection_reused(self):
+        server = self._mail_server(self.sink.address[1])
+        for email_to in ("first@example.com", "second@example.com"):
+            mail = self._dispatch(server, email_to)
+            self.assertEqual(mail.state, "sent")
+            self.sink.wait_for(email_to)
+        self.assertEqual(self.sink.connections, 1)
+
+    def test_dropped_connection_resent(self):
+        server = self._mail_server(self.sink.address[1])
+        self._dispatch(server, "first@example.com")
+        self.sink.wait_for("first@example.com")
+        # The idle connection is reused without NOOP and breaks on MAIL FROM.
+        self.sink.drop_connections()
+        mail = self._dispatch(server, "second@example.com")
+        self.assertEqual(mail.state, "sent")
+        self.sink.wait_for("second@example.com")
+        self.assertEqual(self.sink.connections, 2)
+
+    def test_connect_failure(self):
+        with socket.socket() as closed:
+            closed.bind(("127.0.0.1", 0))
+            port = closed.getsockname()[1]
+        server = self._mail_server(port)
+        # No server listens: the request gets a failed mail, not an error.
+        mail = self._dispatch(server, "nobody@example.com")
+        self.assertEqual(mail.state, "exception")
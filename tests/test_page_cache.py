@@ -0,0 +1,60 @@
+import re
+
+from odoo.tests import HttpCase, tagged
+
+from odoo.addons.otp_login.utils import page_cache
+
+CSRF_TOKEN = re.compile(r'name="csrf_token"\s+value="([^"]*)"')
+
+
+@tagged("post_install", "-at_install")
+class TestOtpPageCache(HttpCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        ICP = cls.env["ir.config_parameter"].sudo()
+        ICP.set_param("otp_login.page_cache_seconds", 300)
+        ICP.set_param("auth_signup.invitation_scope", "b2c")
+
+    def assertPageCached(self, url):
+        """``url`` is served (200), then revalidated from its ETag (304)."""
+        response = self.url_open(url, allow_redirects=False)
+        self.assertEqual(response.status_code, 200)
+        etag = response.headers.get("ETag")
+        self.assertTrue(etag)
+        self.assertIn("Cookie", response.headers.get("Vary", ""))
+        self.assertIn("private", response.headers.get("Cache-Control", ""))
+        token = CSRF_TOKEN.search(response.text)
+        if token:
+            # The no-JS form post works: the visitor gets a token of its own...
+            self.assertTrue(token.group(1))
+            self.assertNotEqual(token.group(1), page_cache.CSRF_PLACEHOLDER)
+            # ...which never ends up in the cached rendering.
+            for body, _etag, _modified in page_cache._page_cache._data.values():
+                self.assertNotIn(token.group(1).encode(), body)
+
+        response = self.url_open(url, headers={"If-None-Match": etag}, allow_redirects=False)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.headers.get("ETag"), etag)
+        self.assertNotIn("Set-Cookie", response.headers)
+        self.assertIn("private", response.headers.get("Cache-Control", ""))
+        self.assertIn("Cookie", response.headers.get("Vary", ""))
+        return response
+
+    def test_otp_login_page(self):
+        self.assertPageCached("/web/login?otp_login=true")
+
+    def test_otp_code_page(self):
+        self.assertPageCached("/web/login?otp_login=true&otp=true")
+
+    def test_signup_page(self):
+        self.assertPageCached("/web/signup")
+
+    def test_signup_page_tokens(self):
+        """Two visitors of the same cached page get their own CSRF token."""
+        first = CSRF_TOKEN.search(self.url_open("/web/signup").text).group(1)
+        self.opener.cookies.clear()
+        second = CSRF_TOKEN.search(self.url_open("/web/signup").text).group(1)
+        self.assertTrue(first and second)
+        self.assertNotEqual(first, second)
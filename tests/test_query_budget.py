@@ -0,0 +1,169 @@
+import difflib
+import json
+import os
+import re
+from contextlib import contextmanager
+from unittest.mock import patch
+
+from odoo.sql_db import Cursor
+from odoo.tests import HttpCase, new_test_user, tagged
+
+from odoo.addons.otp_login.utils.login_ticket import issue_login_ticket
+from odoo.addons.otp_login.utils.otp_generator import OtpGenerator
+
+OTP = "4242"
+PASSWORD = "Budget#Pass123"
+
+# Query count and normalized statements of each measured request, caches
+# warm, recorded on an install with OTP_QUERY_BUDGET_RECORD=1 set: after a
+# deliberate change, record again and commit the file.
+BUDGETS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "query_budgets.json")
+RECORD = bool(os.environ.get("OTP_QUERY_BUDGET_RECORD"))
+
+_LITERALS = re.compile(r"'(?:[^']|'')*'|\b\d+\b")
+_SPACES = re.compile(r"\s+")
+
+
+def normalize_query(query):
+    """``query`` with its literals replaced by ``?`` and spaces collapsed."""
+    query = getattr(query, "code", query)  # odoo.tools.SQL
+    return _SPACES.sub(" ", _LITERALS.sub("?", query)).strip()
+
+
+@tagged("post_install", "-at_install")
+class TestOtpQueryBudget(HttpCase):
+    """
+    SQL query budgets of the OTP routes and of ``ResUsers._login``. Every
+    flow runs once with other users to warm the caches, then once measured
+    against the count and the statements in ``query_budgets.json``.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.budgets = {}
+        if os.path.exists(BUDGETS_FILE):
+            with open(BUDGETS_FILE) as budgets:
+                cls.budgets = json.load(budgets)
+        cls.recorded = {}
+        ICP = cls.env["ir.config_parameter"].sudo()
+        ICP.set_param("otp_login.rate_limit_email", "0/1")
+        ICP.set_param("otp_login.rate_limit_ip", "0/1")
+        ICP.set_param("otp_login.mail_dispatch", "queued")
+        ICP.set_param("auth_signup.invitation_scope", "b2c")
+        for login in ("warm@example.com", "budget@example.com", "warm-json@example.com", "budget-json@example.com"):
+            new_test_user(cls.env, login=login, email=login, groups="base.group_portal")
+
+    @classmethod
+    def tearDownClass(cls):
+        if RECORD and cls.recorded:
+            with open(BUDGETS_FILE, "w") as budgets:
+                json.dump(dict(cls.budgets, **cls.recorded), budgets, indent=2, sort_keys=True)
+                budgets.write("\n")
+        super().tearDownClass()
+
+    def setUp(self):
+        super().setUp()
+        patcher = patch.object(OtpGenerator, "generate", return_value=OTP)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    @contextmanager
+    def _budget(self, name, measure):
+        if not measure:
+            yield
+            return
+        budget = self.budgets.get(name)
+        if budget is None and not RECORD:
+            self.fail(f"No query budget recorded for {name}: run this test with OTP_QUERY_BUDGET_RECORD=1")
+        statements = []
+        execute = Cursor.execute
+
+        def recording_execute(cr, query, *args, **kwargs):
+            statements.append(normalize_query(query))
+            return execute(cr, query, *args, **kwargs)
+
+        with patch.object(Cursor, "execute", recording_execute):
+            if RECORD:
+                yield
+                self.env.flush_all()
+            else:
+                with self.assertQueryCount(budget["count"]):
+                    yield
+        if RECORD:
+            self.recorded[name] = {"count": len(statements), "statements": statements}
+        elif statements != budget["statements"]:
+            diff = "\n".join(difflib.unified_diff(
+                budget["statements"], statements, "recorded", "measured", lineterm="",
+            ))
+            self.fail(f"The queries of {name} changed, record them again if this is expected:\n{diff}")
+
+    def _json(self, route, values):
+        body = json.dumps({"jsonrpc": "2.0", "method": "call", "params": {}, **values})
+        response = self.url_open(route, data=body, headers={"Content-Type": "application/json"})
+        self.assertEqual(response.status_code, 200)
+        return response.json()["result"]
+
+    def _login_flow(self, login, measure=False):
+        self.url_open("/web/session/logout", allow_redirects=False)
+        with self._budget("/web/login?otp_login=true", measure):
+            response = self.url_open("/web/login?otp_login=true", allow_redirects=False)
+        self.assertEqual(response.status_code, 200)
+        with self._budget("/web/otp/login", measure):
+            response = self.url_open("/web/otp/login", data={"login": login})
+        self.assertEqual(response.status_code, 200)
+        with self._budget("/web/otp/resend", measure):
+            self.assertEqual(self._json("/web/otp/resend", {"login": login})["status"], "success")
+        with self._budget("/web/otp/verify", measure):
+            response = self.url_open("/web/otp/verify", data={"login": login, "otp": OTP}, allow_redirects=False)
+        self.assertIn(response.status_code, (302, 303))
+
+    def _login_json_flow(self, login, measure=False):
+        self.url_open("/web/session/logout", allow_redirects=False)
+        with self._budget("/web/otp/login/json", measure):
+            self.assertEqual(self._json("/web/otp/login/json", {"login": login})["status"], "success")
+        with self._budget("/web/otp/verify/json", measure):
+            result = self._json("/web/otp/verify/json", {"login": login, "otp": OTP})
+        self.assertEqual(result["status"], "success")
+
+    def _signup_flow(self, login, measure=False):
+        self.url_open("/web/session/logout", allow_redirects=False)
+        values = {
+            "login": login, "name": login.split("@")[0], "password": PASSWORD,
+            "confirm_password": PASSWORD, "terms_conditions": "on",
+            "csrf_token": self.url_open("/web/otp/csrf").json()["csrf_token"],
+        }
+        with self._budget("/web/signup/otp", measure):
+            response = self.url_open("/web/signup/otp", data=values)
+        self.assertEqual(response.status_code, 200)
+        # The hashing thread only starts after a commit, which never happens
+        # in a test: store the hash it would have written.
+        pending = self.env["otp.signup.pending"].search([("email", "=", login)])
+        pending.password_hash = self.env["res.users"]._crypt_context().hash(PASSWORD)
+        pending.flush_recordset()
+        values.update(otp=OTP)
+        with self._budget("/web/signup/otp/verify", measure):
+            response = self.url_open("/web/signup/otp/verify", data=values, allow_redirects=False)
+        self.assertIn(response.status_code, (302, 303))
+        self.assertTrue(self.env["res.users"].search([("login", "=", login)]))
+
+    def test_login_routes(self):
+        self._login_flow("warm@example.com")
+        self._login_flow("budget@example.com", measure=True)
+
+    def test_login_json_routes(self):
+        self._login_json_flow("warm-json@example.com")
+        self._login_json_flow("budget-json@example.com", measure=True)
+
+    def test_signup_routes(self):
+        self._signup_flow("warm-signup@example.com")
+        self._signup_flow("budget-signup@example.com", measure=True)
+
+    def test_login_with_ticket(self):
+        Users = self.env["res.users"]
+        for login, measure in (("warm@example.com", False), ("budget@example.com", True)):
+            user = Users.search([("login", "=", login)])
+            credential = {"login": login, "password": issue_login_ticket(self.env, user.id), "type": "password"}
+            with self._budget("ResUsers._login", measure):
+                auth_info = Users._login(self.env.cr.dbname, credential, {"interactive": True})
+            self.assertEqual(auth_info["uid"], user.id)
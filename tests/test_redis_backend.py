@@ -0,0 +1,146 @@
+import shutil
+import socket
+import subprocess
+import threading
+import time
+import unittest
+
+from odoo.tests import TransactionCase, tagged
+
+from odoo.addons.otp_login.utils.otp_store import RedisOtpStore, redis
+from odoo.addons.otp_login.utils.rate_limit import RedisBucketStore
+
+REDIS_SERVER = shutil.which("redis-server")
+
+
+@unittest.skipUnless(redis and REDIS_SERVER, "needs the redis python package and a local redis-server")
+@tagged("post_install", "-at_install")
+class TestOtpRedisBackend(TransactionCase):
+    """
+    Lua scripts of the ``redis`` OTP store and rate limiter, on a private
+    ``redis-server`` started for the class. Each store gets a client of its
+    own, like two Odoo workers.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        with socket.socket() as free:
+            free.bind(("127.0.0.1", 0))
+            cls.port = free.getsockname()[1]
+        cls.server = subprocess.Popen(
+            [REDIS_SERVER, "--port", str(cls.port), "--bind", "127.0.0.1", "--save", "", "--appendonly", "no"],
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        )
+        cls.addClassCleanup(cls.server.wait)
+        cls.addClassCleanup(cls.server.terminate)
+        deadline = time.monotonic() + 10
+        while True:
+            try:
+                cls._client().ping()
+                break
+            except redis.ConnectionError:
+                if time.monotonic() >= deadline:
+                    raise
+                time.sleep(0.05)
+
+    @classmethod
+    def _client(cls):
+        return redis.Redis(host="127.0.0.1", port=cls.port)
+
+    def setUp(self):
+        super().setUp()
+        self.client = self._client()
+        self.client.flushdb()
+        self.addCleanup(self.client.close)
+
+    def _store(self, **kwargs):
+        client = self._client()
+        self.addCleanup(client.close)
+        return RedisOtpStore(self.env, client, prefix="otp_login:test:otp:", **kwargs)
+
+    # -------------------------------------------------------------------------
+    # OTP store
+    # -------------------------------------------------------------------------
+    def test_code_expires(self):
+        store = self._store(lifetime=10)
+        store.issue("User@Example.com", "4242")
+        key = store._key("user@example.com")
+        self.assertAlmostEqual(self.client.ttl(key), 600, delta=5)
+        self.assertNotIn(b"4242", self.client.get(key))
+        self.client.pexpire(key, 50)
+        time.sleep(0.2)
+        self.assertFalse(store.verify("user@example.com", "4242"))
+
+    def test_consumed_once_across_clients(self):
+        store = self._store()
+        store.issue("race@example.com", "4242")
+        workers = [self._store(), self._store()]
+        barrier = threading.Barrier(len(workers))
+        results = []
+
+        def verify(worker):
+            barrier.wait()
+            results.append(worker.verify("race@example.com", "4242"))
+
+        threads = [threading.Thread(target=verify, args=(worker,)) for worker in workers]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(sorted(results, key=str), [False, "verified"])
+        self.assertFalse(self.client.exists(store._key("race@example.com"), store._resend_key("race@example.com")))
+
+    def test_wrong_code_consumes(self):
+        first, second = self._store(), self._store()
+        first.issue("user@example.com", "4242")
+        self.assertEqual(second.verify("user@example.com", "0000"), "rejected")
+        self.assertFalse(first.verify("user@example.com", "4242"))
+
+    def test_coalesce(self):
+        first, second = self._store(resend_window=30), self._store(resend_window=30)
+        self.assertEqual(first.coalesce("user@example.com"), 0)
+        first.issue("user@example.com", "4242")
+        self.assertAlmostEqual(self.client.ttl(first._resend_key("user@example.com")), 30, delta=2)
+        self.assertEqual(first.coalesce("user@example.com"), 1)
+        self.assertEqual(second.coalesce("user@example.com"), 2)
+        # The resend window is over: a new code is issued.
+        self.client.pexpire(first._resend_key("user@example.com"), 50)
+        time.sleep(0.2)
+        self.assertEqual(second.coalesce("user@example.com"), 0)
+
+    def test_coalesce_consumed_code(self):
+        store = self._store(resend_window=30)
+        store.issue("user@example.com", "4242")
+        self.assertEqual(store.verify("user@example.com", "4242"), "verified")
+        self.assertEqual(store.coalesce("user@example.com"), 0)
+
+    # -------------------------------------------------------------------------
+    # Rate limiter
+    # -------------------------------------------------------------------------
+    def _buckets(self):
+        client = self._client()
+        self.addCleanup(client.close)
+        return RedisBucketStore(client, prefix="otp_login:test:rl:")
+
+    def test_bucket_shared_across_clients(self):
+        first, second = self._buckets(), self._buckets()
+        now = int(time.time())
+        # 2 requests, then 1 every 2 seconds
+        self.assertEqual(first.take("login:ip:1.2.3.4", 2, 0.5, now), 0)
+        self.assertEqual(second.take("login:ip:1.2.3.4", 2, 0.5, now), 0)
+        self.assertEqual(first.take("login:ip:1.2.3.4", 2, 0.5, now), 2)
+        self.assertEqual(second.take("login:ip:5.6.7.8", 2, 0.5, now), 0)
+
+    def test_bucket_refills(self):
+        buckets = self._buckets()
+        now = int(time.time())
+        self.assertEqual(buckets.take("login:email:a@example.com", 1, 0.5, now), 0)
+        self.assertEqual(buckets.take("login:email:a@example.com", 1, 0.5, now + 1), 1)
+        self.assertEqual(buckets.take("login:email:a@example.com", 1, 0.5, now + 2), 0)
+
+    def test_bucket_expires(self):
+        buckets = self._buckets()
+        buckets.take("login:email:a@example.com", 2, 0.5, int(time.time()))
+        # Kept until it would be full again, plus a second.
+        self.assertAlmostEqual(self.client.ttl("otp_login:test:rl:login:email:a@example.com"), 5, delta=1)
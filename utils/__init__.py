@@ -1 +1,11 @@
-from . import email_templates
\ No newline at end of file
+from . import lru_cache
+from . import css_inline
+from . import email_templates
+from . import otp_store
+from . import rate_limit
+from . import login_ticket
+from . import metrics
+from . import password_policy
+from . import otp_generator
+from . import otp_transport
+from . import page_cache
@@ -0,0 +1,179 @@
+# -*- coding: utf-8 -*-
+"""
+Minimal CSS inliner and HTML minifier for the OTP emails.
+
+Many mail clients drop ``<style>`` blocks, so the theme rules are copied into
+the ``style`` attribute of every element they match. Only what the email
+themes use is supported: type, class and id selectors, compounds of those
+(``span.badge``), descendant combinators (``.header img``) and selector
+lists. Pseudo-classes, attribute selectors and at-rules are ignored.
+
+Text is left untouched apart from whitespace, so ``str.format`` placeholders
+in the markup survive and the result can still be formatted.
+"""
+import re
+from html import escape
+from html.parser import HTMLParser
+
+VOID_ELEMENTS = frozenset((
+    "area", "base", "br", "col", "embed", "hr", "img", "input", "link", "meta", "source", "track", "wbr",
+))
+
+_COMMENT = re.compile(r"/\*.*?\*/", re.S)
+_RULE = re.compile(r"([^{}]+)\{([^{}]*)\}")
+_SIMPLE = re.compile(r"^([a-zA-Z][\w-]*|\*)?((?:[.#][\w-]+)*)$")
+_SPACES = re.compile(r"\s+")
+_COMMA = re.compile(r"\s*,\s*")
+
+
+def _parse_simple(selector):
+    """Return (tag, classes, ids) of a compound selector, None if unsupported."""
+    match = _SIMPLE.match(selector)
+    if not match or not selector:
+        return None
+    tag = match.group(1) if match.group(1) not in (None, "*") else None
+    parts = re.findall(r"([.#])([\w-]+)", match.group(2))
+    classes = frozenset(name for kind, name in parts if kind == ".")
+    ids = frozenset(name for kind, name in parts if kind == "#")
+    return tag, classes, ids
+
+
+def parse_declarations(body):
+    """Return the (property, value) pairs of a declaration block."""
+    declarations = []
+    for declaration in body.split(";"):
+        prop, sep, value = declaration.partition(":")
+        if sep and prop.strip() and value.strip():
+            declarations.append((prop.strip().lower(), _COMMA.sub(",", _SPACES.sub(" ", value.strip()))))
+    return declarations
+
+
+def parse_css(css):
+    """
+    Return the rules of ``css`` as a list of (specificity, order, selector,
+    declarations), ``selector`` being a tuple of compound selectors from the
+    outermost ancestor to the element and ``declarations`` a list of
+    (property, value).
+    """
+    rules = []
+    for selectors, body in _RULE.findall(_COMMENT.sub("", css)):
+        declarations = parse_declarations(body)
+        if not declarations:
+            continue
+        for selector in selectors.split(","):
+            compounds = tuple(_parse_simple(part) for part in selector.split())
+            if not compounds or None in compounds:
+                continue
+            specificity = (
+                sum(len(ids) for _tag, _classes, ids in compounds),
+                sum(len(classes) for _tag, classes, _ids in compounds),
+                sum(1 for tag, _classes, _ids in compounds if tag),
+            )
+            rules.append((specificity, len(rules), compounds, declarations))
+    rules.sort(key=lambda rule: rule[:2])
+    return rules
+
+
+def _matches(compound, element):
+    tag, classes, ids = compound
+    element_tag, element_classes, element_id = element
+    return (tag is None or tag == element_tag) and classes <= element_classes and ids <= {element_id}
+
+
+def _selector_matches(compounds, element, ancestors):
+    if not _matches(compounds[-1], element):
+        return False
+    # Descendant combinators only: match the remaining compounds against the
+    # ancestors from the nearest one outwards, greedily.
+    remaining = list(compounds[:-1])
+    for ancestor in reversed(ancestors):
+        if not remaining:
+            break
+        if _matches(remaining[-1], ancestor):
+            remaining.pop()
+    return not remaining
+
+
+class _Inliner(HTMLParser):
+
+    def __init__(self, rules, minify):
+        super().__init__(convert_charrefs=False)
+        self.rules = rules
+        self.minify = minify
+        self.out = []
+        self.ancestors = []
+
+    def _style(self, tag, attrs):
+        element = (tag, frozenset((attrs.get("class") or "").split()), attrs.get("id"))
+        declarations = [
+            declaration
+            for _specificity, _order, compounds, rule_declarations in self.rules
+            if _selector_matches(compounds, element, self.ancestors)
+            for declaration in rule_declarations
+        ]
+        # The element's own style attribute wins over the stylesheet.
+        declarations += parse_declarations(attrs.get("style") or "")
+        styles = {}
+        for prop, value in declarations:
+            styles.pop(prop, None)
+            styles[prop] = value
+        return element, ";".join(f"{prop}:{value}" for prop, value in styles.items())
+
+    def _start(self, tag, attrs, closed):
+        attrs = dict(attrs)
+        element, style = self._style(tag, attrs)
+        if style:
+            attrs["style"] = style
+        rendered = "".join(
+            f" {name}" if value is None else f' {name}="{escape(value, quote=False).replace(chr(34), "&quot;")}"'
+            for name, value in attrs.items()
+        )
+        self.out.append(f"<{tag}{rendered}{' /' if closed else ''}>")
+        if not closed and tag not in VOID_ELEMENTS:
+            self.ancestors.append(element)
+
+    def handle_starttag(self, tag, attrs):
+        self._start(tag, attrs, False)
+
+    def handle_startendtag(self, tag, attrs):
+        self._start(tag, attrs, True)
+
+    def handle_endtag(self, tag):
+        for index in range(len(self.ancestors) - 1, -1, -1):
+            if self.ancestors[index][0] == tag:
+                del self.ancestors[index:]
+                break
+        self.out.append(f"</{tag}>")
+
+    def handle_data(self, data):
+        if self.minify:
+            data = _SPACES.sub(" ", data)
+            if data == " ":
+                return
+        self.out.append(data)
+
+    def handle_entityref(self, name):
+        self.out.append(f"&{name};")
+
+    def handle_charref(self, name):
+        self.out.append(f"&#{name};")
+
+    def handle_comment(self, data):
+        if not self.minify:
+            self.out.append(f"<!--{data}-->")
+
+    def handle_decl(self, decl):
+        self.out.append(f"<!{decl}>")
+
+
+def inline_css(html, css, minify=True):
+    """
+    Return ``html`` with the rules of ``css`` copied into the style attribute
+    of the elements they match, class and id attributes kept. With
+    ``minify``, runs of whitespace are collapsed, whitespace-only text
+    between tags and comments are removed.
+    """
+    parser = _Inliner(parse_css(css), minify)
+    parser.feed(html)
+    parser.close()
+    return "".join(parser.out).strip()
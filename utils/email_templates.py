@@ -1,7 +1,10 @@
 # -*- coding: utf-8 -*-
-from odoo import _
+from markupsafe import escape
 import logging
 
+from .css_inline import inline_css
+from .lru_cache import LRUCache
+
 _logger = logging.getLogger(__name__)
 
 # -------------------------------------------------------------------------
@@ -193,27 +196,37 @@ EMAIL_THEMES = {
     """,
 }
 
-
+EMAIL_THEME_SELECTION = [
+    ("classic", "Classic"),
+    ("modern-dark", "Modern Dark"),
+    ("neogreen", "Neo Green"),
+]
+DEFAULT_EMAIL_THEME = "neogreen"
 
 
 # -------------------------------------------------------------------------
-# MAIN FUNCTION
+# TEMPLATES
 # -------------------------------------------------------------------------
-def otp_login_html(company_logo, company_name, name, otp_code, company_phone, company_website, view_look="classic"):
-    """
-    Returns the full HTML email body for login/OTP verification.
-    Supports multiple modern CSS looks defined in EMAIL_THEMES.
-    """
-    css_style = EMAIL_THEMES.get(view_look, EMAIL_THEMES["classic"])
-    _logger.debug("Generating signup HTML with look: %s", view_look)
+# Per-message fields are left as markers in the cached skeleton and filled
+# in at send time; everything else only depends on kind/theme/company/lang.
+_NAME_MARK = "\x00name\x00"
+_OTP_MARK = "\x00otp\x00"
 
-    logo_html = f"<img src='{company_logo}' alt='{company_name}'>" if company_logo else ""
+EMAIL_KINDS = {
+    "login": {
+        "intro": "To complete your login to <b>{company_name}</b>, please use the OTP below:",
+        "signature": "{company_name} Security Team",
+    },
+    "signup": {
+        "intro": "Welcome to <b>{company_name}</b>! Please verify your email by entering the OTP below.",
+        "signature": "{company_name} Team",
+    },
+}
 
-    body_html = f"""
+_EMAIL_LAYOUT = """
     <html>
     <head>
         <meta charset="UTF-8">
-        <style>{css_style}</style>
     </head>
     <body>
         <div class="wrapper">
@@ -225,7 +238,7 @@ def otp_login_html(company_logo, company_name, name, otp_code, company_phone, co
             <div class="content">
                 <p>Dear <b>{name}</b>,</p>
                 <p>
-                    To complete your login to <b>{company_name}</b>, please use the OTP below:
+                    {intro}
                 </p>
 
                 <div class="otp-badge">
@@ -236,7 +249,7 @@ def otp_login_html(company_logo, company_name, name, otp_code, company_phone, co
                     ⚠️ This OTP will expire shortly. If you did not initiate this registration, please ignore this email.
                 </p>
 
-                <p style="margin-top:30px;">Best regards,<br><b>{company_name} Security Team</b></p>
+                <p style="margin-top:30px;">Best regards,<br><b>{signature}</b></p>
             </div>
 
             <div class="footer">
@@ -250,59 +263,92 @@ def otp_login_html(company_logo, company_name, name, otp_code, company_phone, co
     </body>
     </html>
     """
-    return body_html
 
+_LOGO_HTML = '<img src="{company_logo}" alt="{company_name}">'
 
 
-def otp_signup_html(company_logo, company_name, name, otp_code, company_phone, company_website, view_look="classic"):
+def _build_theme_layouts():
     """
-    Returns the full HTML email body for signup/OTP verification.
-    Supports multiple modern CSS looks defined in EMAIL_THEMES.
+    Inline the CSS of every theme into the layout, once per process.
+
+    The result is keyed by (theme, has_logo) and is still a format string:
+    placeholders are plain text to the inliner.
     """
-    css_style = EMAIL_THEMES.get(view_look, EMAIL_THEMES["classic"])
-    _logger.debug("Generating signup HTML with look: %s", view_look)
+    layouts = {}
+    for theme, css in EMAIL_THEMES.items():
+        for has_logo in (True, False):
+            layout = _EMAIL_LAYOUT.replace("{logo_html}", _LOGO_HTML if has_logo else "")
+            layouts[theme, has_logo] = inline_css(layout, css)
+    return layouts
 
-    logo_html = f"<img src='{company_logo}' alt='{company_name}'>" if company_logo else ""
 
-    body_html = f"""
-    <html>
-    <head>
-        <meta charset="UTF-8">
-        <style>{css_style}</style>
-    </head>
-    <body>
-        <div class="wrapper">
-            <div class="header">
-                {logo_html}
-                <h2>{company_name}</h2>
-            </div>
+_THEME_LAYOUTS = _build_theme_layouts()
 
-            <div class="content">
-                <p>Dear <b>{name}</b>,</p>
-                <p>
-                    Welcome to <b>{company_name}</b>! Please verify your email by entering the OTP below.
-                </p>
+_skeleton_cache = LRUCache(maxsize=128)
 
-                <div class="otp-badge">
-                    <span>{otp_code}</span>
-                </div>
 
-                <p>
-                    ⚠️ This OTP will expire shortly. If you did not initiate this registration, please ignore this email.
-                </p>
+def _build_skeleton(kind, view_look, company_logo, company_name, company_phone, company_website):
+    """Render the static part of an email, split around the per-message fields."""
+    theme = view_look if view_look in EMAIL_THEMES else "classic"
+    _logger.debug("Building %s email skeleton with look: %s", kind, theme)
 
-                <p style="margin-top:30px;">Best regards,<br><b>{company_name} Team</b></p>
-            </div>
+    texts = EMAIL_KINDS[kind]
+    html = _THEME_LAYOUTS[theme, bool(company_logo)].format(
+        company_logo=company_logo,
+        company_name=company_name,
+        company_website=company_website,
+        intro=texts["intro"].format(company_name=company_name),
+        signature=texts["signature"].format(company_name=company_name),
+        name=_NAME_MARK,
+        otp_code=_OTP_MARK,
+    )
+    head, rest = html.split(_NAME_MARK)
+    middle, tail = rest.split(_OTP_MARK)
+    return head, middle, tail
 
-            <div class="footer">
-                <p>
-                    {company_name}
-                    <a href="{company_website}">{company_website}</a>
-                </p>
-                <p>&copy; {company_name} - All Rights Reserved</p>
-            </div>
-        </div>
-    </body>
-    </html>
+
+def render_otp_email(kind, name, otp_code, company_logo, company_name, company_phone, company_website,
+                     view_look=DEFAULT_EMAIL_THEME, lang=None):
+    """
+    Returns the full HTML email body of ``kind`` ('login' or 'signup').
+
+    The theme CSS is inlined into the markup at import time, the skeleton
+    of each (kind, theme, company, language) combination is built once and
+    kept in a bounded LRU cache; only the recipient name and the OTP code
+    are filled in per message.
+    """
+    key = (kind, view_look, lang, company_logo, company_name, company_phone, company_website)
+    head, middle, tail = _skeleton_cache.get_or_build(key, lambda: _build_skeleton(
+        kind, view_look, company_logo, company_name, company_phone, company_website,
+    ))
+    return f"{head}{escape(name)}{middle}{escape(otp_code)}{tail}"
+
+
+def email_template_cache_info():
+    """Hit/miss counters and size of the email skeleton cache."""
+    return _skeleton_cache.info()
+
+
+def clear_email_template_cache():
+    _skeleton_cache.clear()
+
+
+# -------------------------------------------------------------------------
+# MAIN FUNCTION
+# -------------------------------------------------------------------------
+def otp_login_html(company_logo, company_name, name, otp_code, company_phone, company_website, view_look="classic", lang=None):
+    """
+    Returns the full HTML email body for login/OTP verification.
+    Supports multiple modern CSS looks defined in EMAIL_THEMES.
+    """
+    return render_otp_email("login", name, otp_code, company_logo, company_name, company_phone,
+                            company_website, view_look=view_look, lang=lang)
+
+
+def otp_signup_html(company_logo, company_name, name, otp_code, company_phone, company_website, view_look="classic", lang=None):
+    """
+    Returns the full HTML email body for signup/OTP verification.
+    Supports multiple modern CSS looks defined in EMAIL_THEMES.
     """
-    return body_html
+    return render_otp_email("signup", name, otp_code, company_logo, company_name, company_phone,
+                            company_website, view_look=view_look, lang=lang)
@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+"""
+Single-use login tickets handed from a successful OTP verification to
+``res.users._login``.
+
+A ticket is ``otp_ticket:<uid>:<expiry>:<nonce>:<signature>``, signed with
+the database secret. It never leaves the server: the verify route puts it in
+the login credential of the same request, so the process that issued it is
+the one that consumes it, and remembering outstanding nonces in memory is
+enough to make each ticket usable once.
+"""
+import secrets
+import threading
+import time
+from hmac import compare_digest
+
+from odoo.tools.misc import hmac as odoo_hmac
+
+TICKET_PREFIX = "otp_ticket:"
+TICKET_LIFETIME = 60  # seconds
+TICKET_SCOPE = "otp_login.login_ticket"
+
+_outstanding = {}  # nonce -> expiry
+_lock = threading.Lock()
+
+
+def _sign(env, payload):
+    return odoo_hmac(env(su=True), TICKET_SCOPE, payload)
+
+
+def issue_login_ticket(env, uid):
+    """Return a fresh ticket allowing ``uid`` to log in once."""
+    now = int(time.time())
+    expiry = now + TICKET_LIFETIME
+    nonce = secrets.token_urlsafe(16)
+    payload = f"{uid}:{expiry}:{nonce}"
+    with _lock:
+        for stale in [key for key, value in _outstanding.items() if value < now]:
+            del _outstanding[stale]
+        _outstanding[nonce] = expiry
+    return f"{TICKET_PREFIX}{payload}:{_sign(env, payload)}"
+
+
+def is_login_ticket(value):
+    return isinstance(value, str) and value.startswith(TICKET_PREFIX)
+
+
+def consume_login_ticket(env, ticket):
+    """Return the user id of a valid, unused ``ticket`` and burn it, else None."""
+    if not is_login_ticket(ticket):
+        return None
+    try:
+        uid, expiry, nonce, signature = ticket[len(TICKET_PREFIX):].split(":")
+        uid, expiry = int(uid), int(expiry)
+    except ValueError:
+        return None
+    if expiry < time.time():
+        return None
+    if not compare_digest(signature, _sign(env, f"{uid}:{expiry}:{nonce}")):
+        return None
+    with _lock:
+        if _outstanding.pop(nonce, None) is None:
+            return None
+    return uid
@@ -0,0 +1,125 @@
+# -*- coding: utf-8 -*-
+"""
+In-process counters and latency histograms for the OTP flows, rendered in
+the Prometheus text exposition format by ``/otp_login/metrics``.
+
+Recording a sample is a dictionary update under a lock, cheap enough to stay
+enabled in production. Values are kept per worker process: with prefork
+workers every scrape reports the worker that served it, which is why each
+series carries a ``pid`` label.
+"""
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(names, values, extra=()):
+    pairs = [*zip(names, values), ("pid", os.getpid()), *extra]
+    return "{%s}" % ",".join(f'{name}="{_escape(value)}"' for name, value in pairs)
+
+
+class Counter:
+    def __init__(self, name, documentation, labelnames):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def collect(self):
+        yield f"# HELP {self.name} {self.documentation}"
+        yield f"# TYPE {self.name} counter"
+        with self._lock:
+            values = list(self._values.items())
+        for labels, value in values:
+            yield f"{self.name}{_format_labels(self.labelnames, labels)} {value}"
+
+
+class Histogram:
+    def __init__(self, name, documentation, labelnames, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._values = {}  # labels -> [bucket counts..., sum]
+        self._lock = threading.Lock()
+
+    def observe(self, value, *labels):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._values.get(labels)
+            if series is None:
+                series = self._values[labels] = [0] * (len(self.buckets) + 2)
+            series[index] += 1
+            series[-1] += value
+
+    def collect(self):
+        yield f"# HELP {self.name} {self.documentation}"
+        yield f"# TYPE {self.name} histogram"
+        with self._lock:
+            values = [(labels, list(series)) for labels, series in self._values.items()]
+        for labels, series in values:
+            cumulative = 0
+            for bound, count in zip(self.buckets, series):
+                cumulative += count
+                yield f"{self.name}_bucket{_format_labels(self.labelnames, labels, [('le', repr(bound))])} {cumulative}"
+            cumulative += series[len(self.buckets)]
+            yield f"{self.name}_bucket{_format_labels(self.labelnames, labels, [('le', '+Inf')])} {cumulative}"
+            yield f"{self.name}_sum{_format_labels(self.labelnames, labels)} {series[-1]}"
+            yield f"{self.name}_count{_format_labels(self.labelnames, labels)} {cumulative}"
+
+
+OTP_EVENTS = Counter(
+    "otp_login_events_total",
+    "OTP events by flow: issued, verified, rejected, expired, throttled.",
+    ["flow", "event"],
+)
+OTP_STAGE_SECONDS = Histogram(
+    "otp_login_stage_seconds",
+    "Time spent in each stage of the OTP flows.",
+    ["flow", "stage"],
+)
+METRICS = [OTP_EVENTS, OTP_STAGE_SECONDS]
+
+
+def count(flow, event, amount=1):
+    OTP_EVENTS.inc(flow, event, amount=amount)
+
+
+@contextmanager
+def timed(flow, stage):
+    """Record the duration of the enclosed block as ``stage`` of ``flow``."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        OTP_STAGE_SECONDS.observe(time.perf_counter() - start, flow, stage)
+
+
+def gauge_lines(name, documentation, value):
+    """Lines of a single unlabelled gauge, for values sampled at scrape time."""
+    return [
+        f"# HELP {name} {documentation}",
+        f"# TYPE {name} gauge",
+        f"{name}{_format_labels((), ())} {value}",
+    ]
+
+
+def render_metrics(extra_lines=()):
+    lines = []
+    for metric in METRICS:
+        lines.extend(metric.collect())
+    lines.extend(extra_lines)
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+"""
+Cryptographically random OTP codes.
+
+Random bytes are drawn from ``os.urandom`` in large blocks and turned into
+alphabet characters with a single ``bytes.translate`` call per block. Bytes
+that would make some characters more likely than others (the top
+``256 % len(alphabet)`` values) are dropped rather than folded with a
+modulo, so every character is equally likely.
+"""
+import os
+import string
+import threading
+
+DEFAULT_OTP_LENGTH = 4
+DEFAULT_OTP_ALPHABET = string.digits
+BUFFER_SIZE = 4096
+
+
+class OtpGenerator:
+    """Thread-safe generator of codes of ``length`` characters of ``alphabet``."""
+
+    def __init__(self, length=DEFAULT_OTP_LENGTH, alphabet=DEFAULT_OTP_ALPHABET, buffer_size=BUFFER_SIZE):
+        if not alphabet.isascii() or not 2 <= len(set(alphabet)) == len(alphabet) <= 256:
+            raise ValueError("OTP alphabet must be 2 to 256 distinct ASCII characters")
+        if length < 1:
+            raise ValueError("OTP length must be positive")
+        self.length = length
+        self.alphabet = alphabet
+        self.buffer_size = buffer_size
+        size = len(alphabet)
+        limit = 256 - 256 % size
+        self._table = bytes(ord(alphabet[byte % size]) for byte in range(256))
+        self._rejected = bytes(range(limit, 256))
+        self._buffer = ""
+        self._pid = os.getpid()
+        self._lock = threading.Lock()
+
+    def _take(self, count):
+        """Return ``count`` random alphabet characters. Caller holds the lock."""
+        if self._pid != os.getpid():
+            # Never hand out characters drawn before a fork: the sibling
+            # workers inherited the very same buffer.
+            self._buffer = ""
+            self._pid = os.getpid()
+        while len(self._buffer) < count:
+            raw = os.urandom(max(self.buffer_size, count * 2))
+            self._buffer += raw.translate(self._table, self._rejected).decode("ascii")
+        chars, self._buffer = self._buffer[:count], self._buffer[count:]
+        return chars
+
+    def generate(self, length=None):
+        length = length or self.length
+        with self._lock:
+            return self._take(length)
+
+    def generate_many(self, count, length=None):
+        """Return ``count`` codes, drawn with a single buffer refill when possible."""
+        length = length or self.length
+        with self._lock:
+            chars = self._take(count * length)
+        return [chars[i:i + length] for i in range(0, count * length, length)]
+
+
+_generators = {}
+_generators_lock = threading.Lock()
+
+
+def get_otp_generator(env=None):
+    """Generator configured with ``otp_login.otp_length`` / ``otp_login.otp_alphabet``."""
+    length, alphabet = DEFAULT_OTP_LENGTH, DEFAULT_OTP_ALPHABET
+    if env is not None:
+        ICP = env["ir.config_parameter"].sudo()
+        length = int(ICP.get_param("otp_login.otp_length", DEFAULT_OTP_LENGTH))
+        alphabet = ICP.get_param("otp_login.otp_alphabet", DEFAULT_OTP_ALPHABET)
+    key = (length, alphabet)
+    with _generators_lock:
+        generator = _generators.get(key)
+        if generator is None:
+            generator = _generators[key] = OtpGenerator(length, alphabet)
+        return generator
@@ -0,0 +1,221 @@
+# -*- coding: utf-8 -*-
+"""
+Storage backends for issued OTP codes.
+
+The controllers never talk to ``otp.verification`` directly: they go through
+the store returned by :func:`get_otp_store`, selected with the
+``otp_login.storage_backend`` system parameter:
+
+* ``db`` (default): the ``otp.verification`` model.
+* ``redis``: a key-value server reachable at ``otp_login.redis_url``. Codes
+  live in a key with a TTL and are checked and removed atomically by a
+  server-side script, so every Odoo worker sees the same state.
+
+Both backends share the same semantics: a new code replaces the previous one
+of the same email, a code is consumed by its first verification attempt and
+is no longer accepted after ``otp_login.otp_lifetime_minutes``. A code asked
+for again within ``otp_login.resend_window_seconds`` of the previous one is
+not issued: the previous code is still on its way, so the request is only
+counted as a resend of it (see :meth:`OtpStore.coalesce`).
+
+Neither backend keeps the code itself: they store :func:`otp_digest`, an
+HMAC keyed with the database secret over the normalized email and the code,
+so a dump of the table or of the key-value server does not reveal live codes.
+"""
+import logging
+import threading
+from hmac import compare_digest
+
+from odoo.tools.misc import hmac as odoo_hmac
+
+try:
+    import redis
+except ImportError:
+    redis = None
+
+_logger = logging.getLogger(__name__)
+
+DEFAULT_OTP_LIFETIME = 10  # minutes
+DEFAULT_RESEND_WINDOW = 30  # seconds
+DEFAULT_REDIS_URL = "redis://localhost:6379/0"
+OTP_DIGEST_SCOPE = "otp_login.otp"
+
+
+def normalize_email(email):
+    """Form under which emails are stored and looked up."""
+    return (email or "").strip().lower()
+
+
+def otp_digest(env, email, otp):
+    """Hex SHA-256 HMAC (64 characters) of ``otp`` issued to ``email``."""
+    return odoo_hmac(env(su=True), OTP_DIGEST_SCOPE, f"{normalize_email(email)}:{otp}")
+
+
+class OtpStore:
+    """Interface of an OTP storage backend."""
+
+    def __init__(self, lifetime=DEFAULT_OTP_LIFETIME, resend_window=DEFAULT_RESEND_WINDOW):
+        self.lifetime = lifetime
+        self.resend_window = resend_window
+
+    def coalesce(self, email):
+        """
+        Count a request for a new code as a resend of the live code of
+        ``email`` when that one was issued less than ``resend_window``
+        seconds ago.
+
+        Returns the resend count of that code, or 0 when a new code must be
+        issued. Codes are only kept as digests, so the previous code can not
+        be mailed again; the caller answers as if it had been.
+        """
+        raise NotImplementedError()
+
+    def issue(self, email, otp):
+        """Store ``otp`` as the live code of ``email``."""
+        raise NotImplementedError()
+
+    def issue_many(self, codes):
+        """Store many codes at once, ``codes`` being (email, otp) pairs."""
+        for email, otp in codes:
+            self.issue(email, otp)
+
+    def verify(self, email, otp):
+        """
+        Check ``otp`` against the live code of ``email`` and consume it.
+
+        Returns 'verified', 'rejected', 'expired', or False when there is no
+        live code for that email.
+        """
+        raise NotImplementedError()
+
+
+class DatabaseOtpStore(OtpStore):
+    """Keeps codes in the ``otp.verification`` model."""
+
+    def __init__(self, env, lifetime=DEFAULT_OTP_LIFETIME, resend_window=DEFAULT_RESEND_WINDOW):
+        super().__init__(lifetime, resend_window)
+        self.model = env["otp.verification"].sudo()
+
+    def coalesce(self, email):
+        if not self.resend_window:
+            return 0
+        return self.model._coalesce_resend(normalize_email(email), self.resend_window)
+
+    def issue(self, email, otp):
+        self.issue_many([(email, otp)])
+
+    def issue_many(self, codes):
+        env = self.model.env
+        self.model.create([
+            {"otp_digest": otp_digest(env, email, otp), "email": normalize_email(email)}
+            for email, otp in codes
+        ])
+
+    def verify(self, email, otp):
+        return self.model._verify_and_consume(email, otp, lifetime=self.lifetime)
+
+
+class RedisOtpStore(OtpStore):
+    """Keeps codes in a Redis-compatible key-value server."""
+
+    # Get-and-delete in one round trip: the key is removed whatever the
+    # outcome, exactly like a database row is consumed by its first attempt.
+    # The digest is then compared on the Odoo side, in constant time.
+    CONSUME_SCRIPT = """
+        local stored = redis.call('GET', KEYS[1])
+        if stored then
+            redis.call('DEL', KEYS[1], KEYS[2])
+        end
+        return stored
+    """
+
+    # Each code comes with a resend counter expiring with the resend window;
+    # it only counts while the code itself is still live.
+    COALESCE_SCRIPT = """
+        if redis.call('EXISTS', KEYS[1]) == 1 and redis.call('EXISTS', KEYS[2]) == 1 then
+            return redis.call('INCR', KEYS[2])
+        end
+        return 0
+    """
+
+    def __init__(self, env, client, lifetime=DEFAULT_OTP_LIFETIME, resend_window=DEFAULT_RESEND_WINDOW,
+                 prefix="otp_login:otp:"):
+        super().__init__(lifetime, resend_window)
+        self.env = env
+        self.client = client
+        self.prefix = prefix
+        self._consume = client.register_script(self.CONSUME_SCRIPT)
+        self._coalesce = client.register_script(self.COALESCE_SCRIPT)
+
+    def _key(self, email):
+        return f"{self.prefix}{normalize_email(email)}"
+
+    def _resend_key(self, email):
+        return f"{self._key(email)}:resends"
+
+    def _set(self, pipe, email, otp):
+        pipe.set(self._key(email), otp_digest(self.env, email, otp), ex=self.lifetime * 60)
+        if self.resend_window:
+            pipe.set(self._resend_key(email), 0, ex=self.resend_window)
+
+    def issue(self, email, otp):
+        self.issue_many([(email, otp)])
+
+    def issue_many(self, codes):
+        with self.client.pipeline(transaction=False) as pipe:
+            for email, otp in codes:
+                self._set(pipe, email, otp)
+            pipe.execute()
+
+    def coalesce(self, email):
+        if not self.resend_window:
+            return 0
+        return int(self._coalesce(keys=[self._key(email), self._resend_key(email)]))
+
+    def verify(self, email, otp):
+        stored = self._consume(keys=[self._key(email), self._resend_key(email)])
+        if stored is None:
+            return False
+        if isinstance(stored, bytes):
+            stored = stored.decode()
+        return "verified" if compare_digest(stored, otp_digest(self.env, email, otp)) else "rejected"
+
+
+_redis_clients = {}
+_redis_lock = threading.Lock()
+
+
+def _get_redis_client(url):
+    """One client (and connection pool) per URL and per worker process."""
+    with _redis_lock:
+        client = _redis_clients.get(url)
+        if client is None:
+            client = _redis_clients[url] = redis.Redis.from_url(url)
+        return client
+
+
+def get_redis_client(env):
+    """
+    Return the shared key-value client of ``env``'s database, or None when
+    the ``redis`` backend is not configured (or not installed).
+    """
+    ICP = env["ir.config_parameter"].sudo()
+    if ICP.get_param("otp_login.storage_backend", "db") != "redis":
+        return None
+    if redis is None:
+        _logger.warning("OTP storage backend 'redis' requires the redis python package, using the database")
+        return None
+    return _get_redis_client(ICP.get_param("otp_login.redis_url", DEFAULT_REDIS_URL))
+
+
+def get_otp_store(env):
+    """Return the OTP store configured for the database of ``env``."""
+    ICP = env["ir.config_parameter"].sudo()
+    lifetime = int(ICP.get_param("otp_login.otp_lifetime_minutes", DEFAULT_OTP_LIFETIME))
+    resend_window = int(ICP.get_param("otp_login.resend_window_seconds", DEFAULT_RESEND_WINDOW))
+    client = get_redis_client(env)
+    if client is not None:
+        return RedisOtpStore(
+            env, client, lifetime=lifetime, resend_window=resend_window, prefix=f"otp_login:{env.cr.dbname}:otp:",
+        )
+    return DatabaseOtpStore(env, lifetime=lifetime, resend_window=resend_window)
@@ -0,0 +1,265 @@
+# -*- coding: utf-8 -*-
+"""
+Delivery transports of the OTP messages.
+
+``mail.mail`` records flagged ``is_otp`` are handed to the transport returned
+by :func:`get_otp_transport`, selected with the ``otp_login.mail_transport``
+system parameter:
+
+* ``default``: ``mail.mail.send()``, one SMTP connection (TLS handshake and
+  login included) per call.
+* ``pooled``: persistent SMTP connections, kept per mail server in a bounded
+  :class:`SmtpPool` of each worker process. An idle connection is checked
+  with ``NOOP`` before it is reused, and a broken one is replaced.
+
+Other channels (SMS gateway, push...) plug in by registering an
+:class:`OtpTransport` subclass with :func:`register_transport`.
+"""
+import logging
+import os
+import smtplib
+import threading
+import time
+from contextlib import contextmanager
+from functools import partial
+
+_logger = logging.getLogger(__name__)
+
+DEFAULT_POOL_SIZE = 4
+DEFAULT_CHECKOUT_TIMEOUT = 5  # seconds
+HEALTH_CHECK_IDLE = 5  # seconds idle before a connection is checked with NOOP
+
+TRANSPORTS = {}
+
+
+class PoolExhausted(Exception):
+    """No pooled connection was released in time."""
+
+
+def register_transport(name):
+    """Class decorator adding an :class:`OtpTransport` to the registry under ``name``."""
+    def decorator(cls):
+        TRANSPORTS[name] = cls
+        return cls
+    return decorator
+
+
+class OtpTransport:
+    """Interface of an OTP delivery channel."""
+
+    def __init__(self, env):
+        self.env = env
+
+    def deliver(self, mails, auto_commit=False):
+        """Deliver the OTP ``mail.mail`` records ``mails``."""
+        raise NotImplementedError()
+
+
+@register_transport("default")
+class DefaultTransport(OtpTransport):
+    """Odoo's own mail sending: a new SMTP connection per call."""
+
+    def deliver(self, mails, auto_commit=False):
+        mails.send(auto_commit=auto_commit)
+
+
+class SmtpPool:
+    """
+    Bounded pool of persistent connections to one SMTP server.
+
+    At most ``size`` connections are open at once; :meth:`connection`
+    waits up to ``timeout`` seconds for one to be released and raises
+    :class:`PoolExhausted` after that.
+    """
+
+    def __init__(self, size=DEFAULT_POOL_SIZE, timeout=DEFAULT_CHECKOUT_TIMEOUT,
+                 health_check_idle=HEALTH_CHECK_IDLE):
+        self.size = size
+        self.timeout = timeout
+        self.health_check_idle = health_check_idle
+        self.opened = 0
+        self.reused = 0
+        self._idle = []  # (connection, released at), most recent last
+        self._discarded = set()
+        self._slots = threading.BoundedSemaphore(size)
+        self._lock = threading.Lock()
+
+    def _is_alive(self, connection):
+        try:
+            return connection.noop()[0] == 250
+        except (smtplib.SMTPException, OSError):
+            return False
+
+    @staticmethod
+    def _close(connection):
+        try:
+            connection.quit()
+        except (smtplib.SMTPException, OSError):
+            connection.close()
+
+    def _checkout(self, connect):
+        while True:
+            with self._lock:
+                if not self._idle:
+                    break
+                connection, released = self._idle.pop()
+            if time.monotonic() - released < self.health_check_idle or self._is_alive(connection):
+                with self._lock:
+                    self.reused += 1
+                return connection
+            _logger.info("Dropping broken pooled SMTP connection")
+            connection.close()
+        connection = connect()
+        with self._lock:
+            self.opened += 1
+        return connection
+
+    @contextmanager
+    def connection(self, connect):
+        """
+        Lend a connection for the duration of the block, opened with
+        ``connect()`` when no idle one is usable. It goes back to the pool
+        unless the block raised or :meth:`discard` was called on it.
+        """
+        if not self._slots.acquire(timeout=self.timeout):
+            raise PoolExhausted(f"No SMTP connection released within {self.timeout}s")
+        connection = None
+        try:
+            connection = self._checkout(connect)
+            yield connection
+        except BaseException:
+            if connection is not None:
+                self._close(connection)
+            raise
+        else:
+            with self._lock:
+                discarded = id(connection) in self._discarded
+                self._discarded.discard(id(connection))
+                if not discarded:
+                    self._idle.append((connection, time.monotonic()))
+            if discarded:
+                self._close(connection)
+        finally:
+            self._slots.release()
+
+    def discard(self, connection):
+        """Do not return ``connection`` to the pool at the end of its block."""
+        with self._lock:
+            self._discarded.add(id(connection))
+
+    def is_alive(self, connection):
+        return self._is_alive(connection)
+
+    def close(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for connection, _released in idle:
+            self._close(connection)
+
+    def info(self):
+        with self._lock:
+            idle = len(self._idle)
+        return {"size": self.size, "idle": idle, "opened": self.opened, "reused": self.reused}
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+_pools_pid = os.getpid()
+
+
+def get_smtp_pool(key, size=DEFAULT_POOL_SIZE):
+    """Return the pool of ``key`` in this process."""
+    global _pools_pid
+    with _pools_lock:
+        if _pools_pid != os.getpid():
+            # Connections opened before a fork belong to the parent process.
+            _pools.clear()
+            _pools_pid = os.getpid()
+        pool = _pools.get(key)
+        if pool is None:
+            pool = _pools[key] = SmtpPool(size=size)
+        return pool
+
+
+def smtp_pools_info():
+    """Per-pool counters, for the metrics endpoint."""
+    with _pools_lock:
+        return {key: pool.info() for key, pool in _pools.items()}
+
+
+@register_transport("pooled")
+class PooledSmtpTransport(OtpTransport):
+    """
+    Sends through pooled connections opened by ``ir.mail_server.connect``
+    and given to ``mail.mail._send`` as its SMTP session.
+
+    When the connection can not be opened or breaks while sending, the
+    mails left unsent are sent once more on a fresh connection, then
+    without the pool, like ``mail.mail.send()`` does.
+    """
+
+    def deliver(self, mails, auto_commit=False):
+        MailServer = self.env["ir.mail_server"].sudo()
+        size = int(self.env["ir.config_parameter"].sudo().get_param("otp_login.mail_pool_size", DEFAULT_POOL_SIZE))
+        for server_id, alias_domain_id, smtp_from, batch_ids in mails._split_by_mail_configuration():
+            server = MailServer.browse(server_id) if server_id else MailServer
+            # A changed server configuration (write_date) gets a new pool.
+            key = (self.env.cr.dbname, server_id, server.write_date if server_id else None, smtp_from)
+            pool = get_smtp_pool(key, size=size)
+            # Pools outlive requests: the connect callable must not, it holds
+            # this request's cursor.
+            connect = partial(MailServer.connect, mail_server_id=server_id, smtp_from=smtp_from)
+            self._deliver_batch(pool, connect, mails.browse(batch_ids), auto_commit, alias_domain_id, server)
+
+    def _deliver_batch(self, pool, connect, batch, auto_commit, alias_domain_id, server):
+        for _attempt in range(2):
+            try:
+                batch = self._send_batch(pool, connect, batch, auto_commit, alias_domain_id, server)
+            except PoolExhausted:
+                _logger.warning("SMTP pool exhausted, sending %s OTP mail(s) without it", len(batch))
+                break
+            except (smtplib.SMTPException, OSError) as error:
+                # Raised by connect(), or by mail.mail._send when the server
+                # disconnects; the pool already closed that connection.
+                _logger.info("Pooled SMTP connection failed: %s", error)
+                batch = self._unsent(batch)
+            if not batch:
+                return
+            _logger.info("Resending %s OTP mail(s)", len(batch))
+        batch.send(auto_commit=auto_commit)
+
+    def _send_batch(self, pool, connect, batch, auto_commit, alias_domain_id, server):
+        """Send ``batch`` on one pooled connection, return the mails to send again."""
+        with pool.connection(connect) as session:
+            batch._send(
+                auto_commit=auto_commit, smtp_session=session,
+                alias_domain_id=alias_domain_id, mail_server=server,
+            )
+            dropped = batch.exists().filtered(
+                lambda mail: mail.state == "exception" and mail.failure_type == "mail_smtp"
+            )
+            # SMTP failures on a connection that still answers NOOP are the
+            # message's own: only a dead connection is worth a second try.
+            if not dropped or pool.is_alive(session):
+                return batch.browse()
+            pool.discard(session)
+        return self._unsent(dropped)
+
+    @staticmethod
+    def _unsent(mails):
+        """The mails of ``mails`` still to send, set back to outgoing."""
+        # mail.mail._send flags a mail as failed before sending it, so the
+        # one a disconnection interrupted is in exception too.
+        unsent = mails.exists().filtered(lambda mail: mail.state in ("outgoing", "exception"))
+        unsent.write({"state": "outgoing", "failure_type": False, "failure_reason": False})
+        return unsent
+
+
+def get_otp_transport(env):
+    """Return the OTP transport configured for the database of ``env``."""
+    name = env["ir.config_parameter"].sudo().get_param("otp_login.mail_transport", "default")
+    transport = TRANSPORTS.get(name)
+    if transport is None:
+        _logger.warning("Unknown OTP mail transport %r, using the default one", name)
+        transport = DefaultTransport
+    return transport(env)
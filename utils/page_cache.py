@@ -0,0 +1,95 @@
+# -*- coding: utf-8 -*-
+"""
+Cache of the public OTP login and signup pages.
+
+The GET pages of the OTP flows hold no per-visitor data but the CSRF token,
+so each (website, language, page) is rendered once per worker with a fixed
+placeholder in place of the token, and every response gets the visitor's
+own token put back in: the forms keep working without JavaScript. Pages
+are served with ``ETag`` and ``Last-Modified`` computed on the rendering
+with the placeholder, so browsers revalidate with a 304 for
+``otp_login.page_cache_seconds``.
+
+Responses hold the visitor's token, so they are ``private`` and vary on
+``Cookie``: a browser keeps one copy per session, and a new session gets a
+page with its own token.
+
+Entries are keyed on the registry cache sequences, so a view, asset or
+translation change (which clears the registry caches on every worker)
+yields a new rendering, and on the website's last write.
+"""
+import hashlib
+from datetime import datetime, timezone
+
+from odoo.http import request
+
+from .lru_cache import LRUCache
+
+DEFAULT_PAGE_CACHE_SECONDS = 300
+CSRF_PLACEHOLDER = "otp-page-cache-csrf-token"
+
+_page_cache = LRUCache(maxsize=64)
+
+
+def page_cache_seconds():
+    """``otp_login.page_cache_seconds``, 0 when the page must not be cached."""
+    ICP = request.env["ir.config_parameter"].sudo()
+    return int(ICP.get_param("otp_login.page_cache_seconds", DEFAULT_PAGE_CACHE_SECONDS))
+
+
+def is_page_cacheable():
+    """Only anonymous GETs are served from the cache."""
+    return (
+        request.httprequest.method == "GET"
+        and request.env.user._is_public()
+        and not request.session.debug
+        and page_cache_seconds() > 0
+    )
+
+
+def _render(template, values):
+    """Encoded page, with ``CSRF_PLACEHOLDER`` wherever the CSRF token goes."""
+    # The token changes every second: blanking it after the render would
+    # miss it when rendering crosses a second, and leak it to every visitor.
+    current = request._get_current_object()
+    current.csrf_token = lambda time_limit=None: CSRF_PLACEHOLDER
+    try:
+        return str(request.render(template, values()).render()).encode()
+    finally:
+        del current.csrf_token
+
+
+def render_cached_page(template, values, variant):
+    """
+    Return the response of ``template`` rendered with ``values()`` (only
+    called on a cache miss), or a 304 when the client's copy is current.
+    """
+    website = getattr(request, "website", None)
+    sequences = getattr(request.env.registry, "cache_sequences", None) or {}
+    key = (
+        request.db, website.id if website else None, website.write_date if website else None,
+        request.env.lang, template, variant, tuple(sorted(sequences.items())),
+    )
+
+    def build():
+        body = _render(template, values)
+        modified = datetime.now(timezone.utc).replace(microsecond=0)
+        return body, hashlib.sha256(body).hexdigest()[:32], modified
+
+    body, etag, modified = _page_cache.get_or_build(key, build)
+    body = body.replace(CSRF_PLACEHOLDER.encode(), request.csrf_token().encode())
+    response = request.make_response(body, headers=[("Content-Type", "text/html; charset=utf-8")])
+    response.set_etag(etag)
+    response.last_modified = modified
+    response.vary.update(("Cookie", "Accept-Language"))
+    response.cache_control.private = True
+    response.cache_control.max_age = page_cache_seconds()
+    return response.make_conditional(request.httprequest)
+
+
+def page_cache_info():
+    return _page_cache.info()
+
+
+def clear_page_cache():
+    _page_cache.clear()
@@ -0,0 +1,119 @@
+# -*- coding: utf-8 -*-
+"""
+The password rules shared by the signup form and ``res.users``.
+
+A candidate is checked in a single pass over its characters and the result
+is the tuple of failed rules (empty when the password is acceptable), so
+callers can report every problem at once.
+"""
+import string
+
+from odoo.tools.translate import _lt
+
+TOO_SHORT = "too_short"
+TOO_LONG = "too_long"
+NO_UPPER = "no_upper"
+NO_LOWER = "no_lower"
+NO_DIGIT = "no_digit"
+NO_SYMBOL = "no_symbol"
+
+DEFAULT_MIN_LENGTH = 8
+DEFAULT_MAX_LENGTH = 20
+DEFAULT_SYMBOLS = string.punctuation
+
+_UPPER = frozenset(string.ascii_uppercase)
+_LOWER = frozenset(string.ascii_lowercase)
+_DIGITS = frozenset(string.digits)
+
+FAILURE_MESSAGES = {
+    NO_UPPER: _lt("one uppercase letter"),
+    NO_LOWER: _lt("one lowercase letter"),
+    NO_DIGIT: _lt("one digit"),
+    NO_SYMBOL: _lt("one special character"),
+}
+
+
+class PasswordPolicy:
+    """Configurable password complexity rules."""
+
+    __slots__ = ("min_length", "max_length", "symbols", "require_upper", "require_lower",
+                 "require_digit", "require_symbol")
+
+    def __init__(self, min_length=DEFAULT_MIN_LENGTH, max_length=DEFAULT_MAX_LENGTH, symbols=DEFAULT_SYMBOLS,
+                 require_upper=True, require_lower=True, require_digit=True, require_symbol=True):
+        self.min_length = min_length
+        self.max_length = max_length  # 0 means no maximum
+        self.symbols = frozenset(symbols)
+        self.require_upper = require_upper
+        self.require_lower = require_lower
+        self.require_digit = require_digit
+        self.require_symbol = require_symbol
+
+    @classmethod
+    def from_env(cls, env):
+        """Policy configured with the ``otp_login.password_*`` system parameters."""
+        ICP = env["ir.config_parameter"].sudo()
+        return cls(
+            min_length=int(ICP.get_param("otp_login.password_min_length", DEFAULT_MIN_LENGTH)),
+            max_length=int(ICP.get_param("otp_login.password_max_length", DEFAULT_MAX_LENGTH)),
+            symbols=ICP.get_param("otp_login.password_symbols", DEFAULT_SYMBOLS),
+        )
+
+    def check(self, password):
+        """Return the tuple of rules ``password`` breaks, empty if it is valid."""
+        password = password or ""
+        missing_upper = self.require_upper
+        missing_lower = self.require_lower
+        missing_digit = self.require_digit
+        missing_symbol = self.require_symbol
+        for char in password:
+            if char in _UPPER:
+                missing_upper = False
+            elif char in _LOWER:
+                missing_lower = False
+            elif char in _DIGITS:
+                missing_digit = False
+            elif char in self.symbols:
+                missing_symbol = False
+            else:
+                continue
+            if not (missing_upper or missing_lower or missing_digit or missing_symbol):
+                break
+        failures = []
+        if len(password) < self.min_length:
+            failures.append(TOO_SHORT)
+        elif self.max_length and len(password) > self.max_length:
+            failures.append(TOO_LONG)
+        if missing_upper:
+            failures.append(NO_UPPER)
+        if missing_lower:
+            failures.append(NO_LOWER)
+        if missing_digit:
+            failures.append(NO_DIGIT)
+        if missing_symbol:
+            failures.append(NO_SYMBOL)
+        return tuple(failures)
+
+    def is_valid(self, password):
+        return not self.check(password)
+
+    def check_many(self, passwords):
+        """Failures of every password of ``passwords``, in the same order."""
+        check = self.check
+        return [check(password) for password in passwords]
+
+    def message(self, failures):
+        """Human readable explanation of ``failures``, None when there are none."""
+        if not failures:
+            return None
+        parts = []
+        if TOO_SHORT in failures or TOO_LONG in failures:
+            if self.max_length:
+                parts.append(str(_lt("Password must be %(min)s–%(max)s characters long.",
+                                     min=self.min_length, max=self.max_length)))
+            else:
+                parts.append(str(_lt("Password must be at least %s characters long.", self.min_length)))
+        missing = [str(FAILURE_MESSAGES[failure]) for failure in failures if failure in FAILURE_MESSAGES]
+        if missing:
+            parts.append(str(_lt("Password must contain at least: %s.", ", ".join(missing))))
+        return " ".join(parts)
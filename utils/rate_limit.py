@@ -0,0 +1,132 @@
+# -*- coding: utf-8 -*-
+"""
+Token-bucket rate limiting for the OTP issue and resend endpoints.
+
+A limit is written ``"<capacity>/<seconds>"``: a bucket holds at most
+``capacity`` tokens and refills at ``capacity / seconds`` tokens per second,
+each request takes one token. A capacity of 0 disables the limit.
+
+Buckets live in the key-value server when the ``redis`` storage backend is
+configured, so the limits hold across all workers. Otherwise each worker
+keeps its own buckets in memory.
+"""
+import logging
+import math
+import threading
+import time
+from collections import OrderedDict
+
+from .otp_store import get_redis_client
+
+_logger = logging.getLogger(__name__)
+
+# Default limits per key kind, see the module docstring for the format.
+DEFAULT_LIMITS = {
+    "email": "5/600",
+    "ip": "20/600",
+}
+
+
+def parse_limit(value):
+    """Return (capacity, refill rate per second) of a ``"<capacity>/<seconds>"`` limit."""
+    try:
+        capacity, seconds = (float(part) for part in str(value).split("/"))
+    except ValueError:
+        raise ValueError(f"Invalid rate limit {value!r}, expected '<capacity>/<seconds>'")
+    if capacity <= 0 or seconds <= 0:
+        return 0, 0
+    return capacity, capacity / seconds
+
+
+class MemoryBucketStore:
+    """Buckets kept in this process, the oldest ones dropped past ``maxsize``."""
+
+    def __init__(self, maxsize=100000):
+        self.maxsize = maxsize
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def take(self, key, capacity, rate, now):
+        with self._lock:
+            tokens, stamp = self._buckets.pop(key, (capacity, now))
+            tokens = min(capacity, tokens + (now - stamp) * rate)
+            retry_after = 0
+            if tokens >= 1:
+                tokens -= 1
+            else:
+                retry_after = math.ceil((1 - tokens) / rate)
+            self._buckets[key] = (tokens, now)
+            while len(self._buckets) > self.maxsize:
+                self._buckets.popitem(last=False)
+            return retry_after
+
+
+class RedisBucketStore:
+    """Buckets kept in the shared key-value server, updated atomically."""
+
+    TAKE_SCRIPT = """
+        local capacity = tonumber(ARGV[1])
+        local rate = tonumber(ARGV[2])
+        local now = tonumber(ARGV[3])
+        local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'stamp')
+        local tokens = tonumber(bucket[1]) or capacity
+        local stamp = tonumber(bucket[2]) or now
+        tokens = math.min(capacity, tokens + math.max(now - stamp, 0) * rate)
+        local retry_after = 0
+        if tokens >= 1 then
+            tokens = tokens - 1
+        else
+            retry_after = math.ceil((1 - tokens) / rate)
+        end
+        redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'stamp', tostring(now))
+        redis.call('EXPIRE', KEYS[1], math.ceil(capacity / rate) + 1)
+        return retry_after
+    """
+
+    def __init__(self, client, prefix):
+        self.prefix = prefix
+        self._take = client.register_script(self.TAKE_SCRIPT)
+
+    def take(self, key, capacity, rate, now):
+        return int(self._take(keys=[self.prefix + key], args=[capacity, rate, now]))
+
+
+_memory_store = MemoryBucketStore()
+
+
+def _get_bucket_store(env):
+    client = get_redis_client(env)
+    if client is not None:
+        return RedisBucketStore(client, prefix=f"otp_login:{env.cr.dbname}:rl:")
+    return _memory_store
+
+
+def check_rate_limit(env, scope, keys):
+    """
+    Take one token from the bucket of every ``(kind, value)`` in ``keys``
+    (kind being 'email' or 'ip') for endpoint ``scope``.
+
+    Returns 0 when the request may proceed, otherwise the number of seconds
+    after which it should be retried.
+    """
+    ICP = env["ir.config_parameter"].sudo()
+    store = None
+    now = time.time()
+    retry_after = 0
+    for kind, value in keys:
+        if not value:
+            continue
+        limit = ICP.get_param(f"otp_login.rate_limit_{kind}", DEFAULT_LIMITS[kind])
+        try:
+            capacity, rate = parse_limit(limit)
+        except ValueError as e:
+            _logger.warning("%s, using %s", e, DEFAULT_LIMITS[kind])
+            capacity, rate = parse_limit(DEFAULT_LIMITS[kind])
+        if not capacity:
+            continue
+        if store is None:
+            store = _get_bucket_store(env)
+        retry_after = max(retry_after, store.take(f"{scope}:{kind}:{value}", capacity, rate, now))
+    if retry_after:
+        _logger.info("OTP %s throttled for %s, retry after %ss", scope, dict(keys), retry_after)
+    return retry_after